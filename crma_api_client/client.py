@@ -1,7 +1,25 @@
 """Contains the CRMA API client"""
 
+import asyncio
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime, timezone as tz
+import json
 import logging
-from typing import Any, Dict, Optional
+import tempfile
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    DefaultDict,
+    Dict,
+    IO,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 from uuid import uuid4
 
 import backoff
@@ -9,14 +27,25 @@ import httpx
 from pydantic import BaseModel
 
 from crma_api_client.resources.dataset import (
+    DatasetsResponse,
+    DatasetSummary,
     DatasetVersionResponse,
     DatasetVersionsResponse,
+    DatasetXmd,
 )
 from crma_api_client.resources.query import QueryLanguage, QueryResponse
 from .encoder import json_dumps_common
+from .profiler import QueryProfile, QueryProfiler, UNNAMED_QUERY
+from .resilience import CircuitBreaker, hedge, HedgePolicy, ResilienceStats
+from .scheduler import PriorityScheduler, RequestPriority
+from .schema import query_fingerprint, SchemaCache, validate_query
+from .spill import parse_spilled_query_response
+from .stats import RollingWindow
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 class ConnectionInfo(BaseModel):
     """Model with info for making API requests to a Salesforce instance"""
@@ -79,6 +108,15 @@ class CRMAAPIClient:
         timeout: float = 60.0,
         connect_timeout: float = 5.0,
         logger: logging.Logger = logger,
+        max_concurrency: Optional[int] = None,
+        aging_interval: float = 5.0,
+        hedge_policy: Optional[HedgePolicy] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        profiler: Optional[QueryProfiler] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        schema_cache: Optional[SchemaCache] = None,
+        spill_threshold: Optional[int] = None,
+        spill_dir: Optional[str] = None,
     ) -> None:
         """Initialize the CRMAAPIClient
 
@@ -89,15 +127,68 @@ class CRMAAPIClient:
             connect_timeout: Default timeout for establishing an HTTP connection, in
                 seconds
             logger: Custom logger instance to use instead of the stdlib
+            max_concurrency: Maximum number of requests in flight at once. Requests
+                beyond this budget are queued and admitted by priority. If None,
+                requests are never queued.
+            aging_interval: Number of seconds a queued request has to wait before it
+                is promoted by one priority class. This prevents starvation of
+                low-priority requests.
+            hedge_policy: Policy for hedging idempotent reads. If None, requests are
+                never hedged.
+            circuit_breaker: Circuit breaker used to fail fast when the instance is
+                unhealthy. If None, requests are always sent.
+            profiler: Profiler that records server, network and client timings for
+                each query. If None, queries are not profiled.
+            transport: Custom HTTP transport, e.g. to record or replay traffic. If
+                None, the default httpx transport is used.
+            schema_cache: Cache of query result schemas, so that repeated queries
+                reuse precomputed fields. If None, schemas are built per response.
+            spill_threshold: Size of a query response payload, in bytes, above which
+                the payload is streamed to disk and its records are spilled to a
+                memory-mapped file instead of being kept in memory. If None, records
+                are never spilled.
+            spill_dir: Directory for spooled payloads and spill files. Defaults to the
+                system temporary directory.
+
+        Raises:
+            ValueError: if spill_threshold is out of range
 
         """
+        if spill_threshold is not None and spill_threshold < 1:
+            raise ValueError("spill_threshold must be at least 1")
         self.logger = logger
+        self._base_path = f"/services/data/{version}"
+        self.scheduler = PriorityScheduler(max_concurrency, aging_interval)
+        self.hedge_policy = hedge_policy
+        self.circuit_breaker = circuit_breaker
+        self.profiler = profiler
+        self.schema_cache = schema_cache
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self._latencies: DefaultDict[str, RollingWindow] = defaultdict(
+            lambda: RollingWindow(hedge_policy.window_size if hedge_policy else 1000)
+        )
+        self._hedges_sent = 0
+        self._hedges_won = 0
         self._client = httpx.AsyncClient(
-            base_url=conn.instance_url.rstrip("/") + f"/services/data/{version}",
+            base_url=conn.instance_url.rstrip("/") + self._base_path,
             headers={"Authorization": conn.authorization},
             timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            transport=transport,
         )
 
+    async def __aenter__(self) -> "CRMAAPIClient":
+        """Enter the client context"""
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        """Exit the client context, closing the underlying connections"""
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP client and its connections"""
+        await self._client.aclose()
+
     async def _get_headers(
         self,
     ) -> Dict[str, str]:
@@ -114,6 +205,18 @@ class CRMAAPIClient:
 
         return headers
 
+    @property
+    def resilience_stats(self) -> ResilienceStats:
+        """Counters for hedged requests and circuit breaker trips"""
+        stats = ResilienceStats(
+            hedges_sent=self._hedges_sent, hedges_won=self._hedges_won
+        )
+        if self.circuit_breaker:
+            stats.circuit_trips = self.circuit_breaker.trip_count
+            stats.circuit_rejections = self.circuit_breaker.rejection_count
+            stats.circuit_state = self.circuit_breaker.state
+        return stats
+
     @backoff.on_exception(
         backoff.expo,
         httpx.HTTPStatusError,
@@ -126,6 +229,8 @@ class CRMAAPIClient:
         method: str,
         json_data: Optional[Any] = None,
         params: Optional[Dict[str, Any]] = None,
+        priority: RequestPriority = RequestPriority.default,
+        body_file: Optional[IO[bytes]] = None,
         **kwargs: Any,
     ) -> httpx.Response:
         """Generic method to send a JSON request to the service
@@ -135,6 +240,11 @@ class CRMAAPIClient:
             method: HTTP method
             json_data: Request payload (for POST/PUT/PATCH requests)
             params: Request query params
+            priority: Priority class used to admit the request when the client is at
+                its concurrency budget
+            body_file: File that the body of a successful response is streamed to
+                instead of being read into memory. The body of an error response is
+                always read into memory.
 
         Returns:
             response object
@@ -144,49 +254,257 @@ class CRMAAPIClient:
         if json_data:
             json_data = json_dumps_common(json_data).encode()
         headers = await self._get_headers()
-        self.logger.debug(f"Service request starting path={path} method={method}")
-        response = await self._client.request(
-            method.upper(),
-            path,
-            headers=headers,
-            content=json_data,
-            params=params,
-            **kwargs,
-        )
-        self.logger.debug(
-            f"Service request completed status_code={response.status_code}"
+        guard = self.circuit_breaker.guard() if self.circuit_breaker else nullcontext()
+        with guard:
+            async with self.scheduler.slot(priority):
+                self.logger.debug(
+                    f"Service request starting path={path} method={method}"
+                    f" priority={priority.name}"
+                )
+                request = self._client.build_request(
+                    method.upper(),
+                    path,
+                    headers=headers,
+                    content=json_data,
+                    params=params,
+                    **kwargs,
+                )
+                response = await self._client.send(
+                    request, stream=body_file is not None
+                )
+                if body_file is not None:
+                    try:
+                        await self._read_body(response, body_file)
+                    finally:
+                        await response.aclose()
+            self.logger.debug(
+                f"Service request completed status_code={response.status_code}"
+            )
+            response.raise_for_status()
+        return response
+
+    async def _read_body(self, response: httpx.Response, body_file: IO[bytes]) -> None:
+        """Read the body of a streamed response into a file
+
+        Spooled files are rolled over to disk up front if the Content-Length exceeds
+        the spill threshold, and otherwise once the bytes written exceed it.
+
+        Args:
+            response: Streamed response
+            body_file: File to write the body of a successful response to
+
+        """
+        if not response.is_success:
+            await response.aread()
+            return
+        content_length = response.headers.get("content-length")
+        if (
+            isinstance(body_file, tempfile.SpooledTemporaryFile)
+            and self.spill_threshold is not None
+            and content_length is not None
+            and int(content_length) > self.spill_threshold
+        ):
+            body_file.rollover()
+        async for chunk in response.aiter_bytes():
+            body_file.write(chunk)
+
+    async def _spooled_request(
+        self,
+        path: str,
+        method: str,
+        json_data: Optional[Any] = None,
+        priority: RequestPriority = RequestPriority.default,
+    ) -> Tuple[httpx.Response, IO[bytes]]:
+        """Send a request, spooling the response body to disk above the spill threshold
+
+        Args:
+            path: Path to the API resource
+            method: HTTP method
+            json_data: Request payload
+            priority: Priority class of the request
+
+        Returns:
+            tuple of (response object, file containing the body, positioned at its
+            end)
+
+        """
+        body = tempfile.SpooledTemporaryFile(
+            max_size=self.spill_threshold, dir=self.spill_dir
         )
-        response.raise_for_status()
+        try:
+            response = await self.request(
+                path, method, json_data=json_data, priority=priority, body_file=body
+            )
+        except BaseException:
+            body.close()
+            raise
+        return response, body
+
+    async def _hedged(
+        self,
+        operation: str,
+        send: Callable[[], Awaitable[T]],
+        enabled: bool = True,
+    ) -> T:
+        """Send an idempotent request, hedging it according to the hedge policy
+
+        Args:
+            operation: Name of the operation, used to track latencies
+            send: Function that starts a new attempt of the request
+            enabled: Whether hedging is allowed for this request
+
+        Returns:
+            result of the attempt that finished first
+
+        """
+        if not self.hedge_policy or not enabled:
+            return await send()
+
+        latencies = self._latencies[operation]
+        delay = self.hedge_policy.delay(latencies)
+        start = time.monotonic()
+        response, hedged, hedge_won = await hedge(send, delay)
+        latencies.add(time.monotonic() - start)
+        if hedged:
+            self._hedges_sent += 1
+            self._hedges_won += hedge_won
+            self.logger.debug(
+                f"Hedged request completed operation={operation} delay={delay:.3f}"
+                f" hedge_won={hedge_won}"
+            )
         return response
 
-    async def list_dataset_versions(self, identifier: str) -> DatasetVersionsResponse:
+    async def list_datasets(
+        self,
+        q: Optional[str] = None,
+        folder_id: Optional[str] = None,
+        page_size: Optional[int] = None,
+        sort: Optional[str] = None,
+        order: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        priority: RequestPriority = RequestPriority.default,
+    ) -> AsyncIterator[DatasetSummary]:
+        """Iterate over all datasets, following the pages of the collection
+
+        The next page is fetched in the background while the current page is being
+        consumed.
+
+        Args:
+            q: Search term that dataset names and labels must match
+            folder_id: Only include datasets in this folder (app)
+            page_size: Number of datasets per page
+            sort: Sort field, e.g. Name or LastModified
+            order: Sort order. One of: Ascending, Descending
+            params: Additional query params used to filter the collection
+            priority: Priority class of the requests
+
+        Yields:
+            datasets from each page of the collection
+
+        """
+        request_params = {
+            key: value
+            for key, value in {
+                "q": q,
+                "folderId": folder_id,
+                "pageSize": page_size,
+                "sort": sort,
+                "order": order,
+                **(params or {}),
+            }.items()
+            if value is not None
+        }
+
+        async def fetch(
+            path: str, params: Optional[Dict[str, Any]] = None
+        ) -> DatasetsResponse:
+            response = await self._hedged(
+                "list_datasets",
+                lambda: self.request(path, "GET", params=params, priority=priority),
+            )
+            return DatasetsResponse.parse_obj(response.json())
+
+        next_page: Optional[asyncio.Task] = asyncio.ensure_future(
+            fetch("/wave/datasets", request_params)
+        )
+        try:
+            while next_page:
+                page = await next_page
+                next_page = None
+                if page.next_page_url:
+                    next_page = asyncio.ensure_future(
+                        fetch(self._relative_path(page.next_page_url))
+                    )
+                for dataset in page.datasets:
+                    yield dataset
+        finally:
+            if next_page:
+                # Retrieve the result of the prefetch, so that a failed page that is
+                # never consumed doesn't log an unretrieved task exception
+                next_page.cancel()
+                await asyncio.gather(next_page, return_exceptions=True)
+
+    def _relative_path(self, url: str) -> str:
+        """Convert a URL returned by the API to a path relative to the base URL
+
+        Args:
+            url: URL path such as ``/services/data/v54.0/wave/datasets?page=abc``
+
+        Returns:
+            path that can be passed to :meth:`request`
+
+        """
+        if url.startswith(self._base_path):
+            return url[len(self._base_path) :]
+        return url
+
+    async def list_dataset_versions(
+        self,
+        identifier: str,
+        priority: RequestPriority = RequestPriority.default,
+    ) -> DatasetVersionsResponse:
         """List the versions for a dataset
 
         Args:
             identifier: Dataset name or ID
+            priority: Priority class of the request
 
         Returns:
             list of all versions for the dataset
 
         """
-        response = await self.request(f"/wave/datasets/{identifier}/versions", "GET")
+        response = await self._hedged(
+            "list_dataset_versions",
+            lambda: self.request(
+                f"/wave/datasets/{identifier}/versions", "GET", priority=priority
+            ),
+        )
         return DatasetVersionsResponse.parse_obj(response.json())
 
     async def get_dataset_version(
-        self, dataset_id: str, version_id: str
+        self,
+        dataset_id: str,
+        version_id: str,
+        priority: RequestPriority = RequestPriority.default,
     ) -> DatasetVersionResponse:
         """Get a single version for a dataset
 
         Args:
             dataset_id: Dataset name or ID
             version_id: Version ID
+            priority: Priority class of the request
 
         Returns:
             the version of the dataset
 
         """
-        response = await self.request(
-            f"/wave/datasets/{dataset_id}/versions/{version_id}", "GET"
+        response = await self._hedged(
+            "get_dataset_version",
+            lambda: self.request(
+                f"/wave/datasets/{dataset_id}/versions/{version_id}",
+                "GET",
+                priority=priority,
+            ),
         )
         return DatasetVersionResponse.parse_obj(response.json())
 
@@ -196,6 +514,8 @@ class CRMAAPIClient:
         query_language: QueryLanguage = QueryLanguage.saql,
         name: Optional[str] = None,
         timezone: Optional[str] = None,
+        priority: RequestPriority = RequestPriority.default,
+        xmd: Optional[DatasetXmd] = None,
     ) -> QueryResponse:
         """Execute a query
 
@@ -204,11 +524,26 @@ class CRMAAPIClient:
             query_language: Query language. One of: SAQL (default), SQL
             name: Query name. Defaults to a UUID
             timezone: Timezone for the query
+            priority: Priority class of the request, e.g. interactive for dashboard
+                queries and batch for background extracts
+            xmd: Extended metadata of the dataset the query loads. If provided, the
+                fields referenced in a SAQL query are validated against it before
+                the request is sent.
+
+        Raises:
+            SchemaValidationError: if the query references fields that are not in
+                the dataset
 
         Returns:
-            query results containing records and metadata
+            query results containing records and metadata. If the payload is larger
+            than the spill threshold, the results are a
+            :class:`~crma_api_client.spill.SpilledQueryResults` backed by a file on
+            disk, which is deleted when the response is closed.
 
         """
+        if xmd is not None and query_language == QueryLanguage.saql:
+            validate_query(query, xmd)
+
         json_data = {
             "query": query,
             "name": name or str(uuid4()),
@@ -217,6 +552,70 @@ class CRMAAPIClient:
         if timezone:
             json_data["timezone"] = timezone
 
-        response = await self.request("/wave/query", "POST", json_data=json_data)
+        async def send() -> Tuple[httpx.Response, Optional[IO[bytes]]]:
+            if self.spill_threshold is None:
+                response = await self.request(
+                    "/wave/query", "POST", json_data=json_data, priority=priority
+                )
+                return response, None
+            return await self._spooled_request(
+                "/wave/query", "POST", json_data=json_data, priority=priority
+            )
+
+        started_at = datetime.now(tz.utc)
+        start = time.perf_counter()
+        response, body = await self._hedged(
+            "query",
+            send,
+            enabled=self.hedge_policy is not None and self.hedge_policy.queries,
+        )
+        received = time.perf_counter()
+        data = None
+        if body is None:
+            payload_size = len(response.content)
+            data = response.json()
+        else:
+            with body:
+                payload_size = body.tell()
+                body.seek(0)
+                if payload_size > self.spill_threshold:
+                    # Records are decoded one at a time and written straight to a
+                    # spill file, so decoding includes writing it
+                    query_response = parse_spilled_query_response(body, self.spill_dir)
+                else:
+                    data = json.load(body)
+        decoded = time.perf_counter()
+        if data is not None:
+            query_response = QueryResponse.parse_obj(data)
+            del data
+        if self.schema_cache is not None:
+            self.schema_cache.apply(
+                query_fingerprint(query, query_language), query_response
+            )
+        parsed = time.perf_counter()
+
+        if self.profiler:
+            server_time = query_response.response_time / 1000
+            try:
+                elapsed = response.elapsed.total_seconds()
+            except RuntimeError:
+                # The elapsed time isn't set for responses whose content was never
+                # streamed, e.g. from a mock transport
+                elapsed = received - start
+            self.profiler.record(
+                QueryProfile(
+                    name=name or UNNAMED_QUERY,
+                    query=query,
+                    started_at=started_at,
+                    wall_time=parsed - start,
+                    server_time=server_time,
+                    network_time=max(elapsed - server_time, 0.0),
+                    queue_time=max(received - start - elapsed, 0.0),
+                    decode_time=decoded - received,
+                    parse_time=parsed - decoded,
+                    row_count=len(query_response.results.records),
+                    payload_size=payload_size,
+                )
+            )
 
-        return QueryResponse.parse_obj(response.json())
+        return query_response
@@ -0,0 +1,242 @@
+"""Contains an executor for graphs of dependent queries, e.g. dashboard steps"""
+
+import asyncio
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from .client import CRMAAPIClient
+from .encoder import json_dumps_common
+from .resources.query import QueryLanguage, QueryResponse
+from .scheduler import RequestPriority
+
+#: Pattern for placeholders in query templates, e.g. {{region}}
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+class QueryGraphError(ValueError):
+    """Raised when a query graph is invalid"""
+
+
+def format_literal(value: Any) -> str:
+    """Format a bound value as a SAQL literal
+
+    Args:
+        value: Bound value
+
+    Returns:
+        SAQL literal. Nulls, including nulls in lists, are formatted as ``null``.
+
+    """
+    if value is None:
+        return "null"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(format_literal(item) for item in value) + "]"
+    return json_dumps_common(value)
+
+
+class Binding(BaseModel):
+    """Value bound from the result of another query"""
+
+    #: Name of the node whose result is bound
+    source: str
+    #: Name of the column to take values from
+    column: str
+    #: Index of the row to bind. If None, all values in the column are bound as a list.
+    row: Optional[int] = 0
+
+    def resolve(self, response: QueryResponse) -> Any:
+        """Get the bound value from a query response
+
+        Args:
+            response: Response of the source query
+
+        Raises:
+            QueryGraphError: if the row is out of range or a record doesn't have the
+                column
+
+        Returns:
+            the bound value
+
+        """
+        records = response.results.records
+        try:
+            if self.row is None:
+                return [record[self.column] for record in records]
+            return records[self.row][self.column]
+        except IndexError:
+            raise QueryGraphError(
+                f"Binding source={self.source} row={self.row} is out of range"
+            ) from None
+        except KeyError:
+            raise QueryGraphError(
+                f"Binding source={self.source} has no column={self.column}"
+            ) from None
+
+
+class QueryNode(BaseModel):
+    """Query template in a query graph
+
+    Placeholders in the template, e.g. ``{{region}}``, are replaced with the values of
+    the bindings with the same name, formatted as SAQL literals by
+    :func:`format_literal`.
+    """
+
+    name: str
+    template: str
+    bindings: Dict[str, Binding] = {}
+    query_language: QueryLanguage = QueryLanguage.saql
+    timezone: Optional[str] = None
+
+    @property
+    def depends_on(self) -> Set[str]:
+        """Names of the nodes this node depends on"""
+        return {binding.source for binding in self.bindings.values()}
+
+    @property
+    def placeholders(self) -> Set[str]:
+        """Names of the placeholders in the template"""
+        return set(PLACEHOLDER_PATTERN.findall(self.template))
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """Fill the template with bound values
+
+        Args:
+            values: Mapping of placeholder name to bound value
+
+        Returns:
+            query string
+
+        """
+        return PLACEHOLDER_PATTERN.sub(
+            lambda match: format_literal(values[match.group(1)]), self.template
+        )
+
+
+class QueryGraph:
+    """Directed acyclic graph of queries where some queries bind values from others
+
+    Independent queries run concurrently, and each query runs as soon as the queries it
+    depends on have completed, so the total latency is that of the critical path.
+    Queries that render to the same query string are only executed once.
+    """
+
+    def __init__(self, nodes: Iterable[QueryNode] = ()) -> None:
+        """Initialize the QueryGraph
+
+        Args:
+            nodes: Nodes in the graph
+
+        """
+        self.nodes: Dict[str, QueryNode] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: QueryNode) -> None:
+        """Add a node to the graph
+
+        Args:
+            node: Node to add
+
+        Raises:
+            QueryGraphError: if a node with the same name already exists
+
+        """
+        if node.name in self.nodes:
+            raise QueryGraphError(f"Duplicate node name={node.name}")
+        self.nodes[node.name] = node
+
+    def validate(self) -> List[str]:
+        """Check the graph and sort it topologically
+
+        Raises:
+            QueryGraphError: if a binding or placeholder is missing, a node depends on
+                an unknown node or the graph has a cycle
+
+        Returns:
+            node names in an order where each node comes after its dependencies
+
+        """
+        for node in self.nodes.values():
+            missing = node.placeholders - set(node.bindings)
+            if missing:
+                raise QueryGraphError(
+                    f"Node name={node.name} has no bindings for {sorted(missing)}"
+                )
+            unknown = node.depends_on - set(self.nodes)
+            if unknown:
+                raise QueryGraphError(
+                    f"Node name={node.name} depends on unknown nodes {sorted(unknown)}"
+                )
+
+        remaining = {name: set(node.depends_on) for name, node in self.nodes.items()}
+        order = []
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items() if not deps)
+            if not ready:
+                raise QueryGraphError(f"Cycle between nodes {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+                order.append(name)
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+        return order
+
+    async def execute(
+        self,
+        client: CRMAAPIClient,
+        priority: RequestPriority = RequestPriority.default,
+    ) -> Dict[str, QueryResponse]:
+        """Execute all queries in the graph
+
+        Args:
+            client: Client used to execute the queries
+            priority: Priority class of the queries
+
+        Returns:
+            mapping of node name to query response
+
+        """
+        order = self.validate()
+        tasks: Dict[str, "asyncio.Task[QueryResponse]"] = {}
+        shared: Dict[
+            Tuple[str, QueryLanguage, Optional[str]], "asyncio.Task[QueryResponse]"
+        ] = {}
+
+        async def run(node: QueryNode) -> QueryResponse:
+            upstream = {name: await tasks[name] for name in node.depends_on}
+            query = node.render(
+                {
+                    placeholder: binding.resolve(upstream[binding.source])
+                    for placeholder, binding in node.bindings.items()
+                }
+            )
+            key = (query, node.query_language, node.timezone)
+            if key not in shared:
+                shared[key] = asyncio.ensure_future(
+                    client.query(
+                        query,
+                        query_language=node.query_language,
+                        name=node.name,
+                        timezone=node.timezone,
+                        priority=priority,
+                    )
+                )
+            return await asyncio.shield(shared[key])
+
+        for name in order:
+            tasks[name] = asyncio.ensure_future(run(self.nodes[name]))
+
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in [*tasks.values(), *shared.values()]:
+                task.cancel()
+            await asyncio.gather(
+                *tasks.values(), *shared.values(), return_exceptions=True
+            )
+            raise
+
+        return {name: task.result() for name, task in tasks.items()}
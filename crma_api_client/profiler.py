@@ -0,0 +1,185 @@
+"""Contains the per-query profiler and slow-query log"""
+
+from collections import defaultdict
+from datetime import datetime
+import logging
+from typing import DefaultDict, Dict, List, Optional
+
+from pydantic import BaseModel
+
+from .stats import RollingWindow
+
+logger = logging.getLogger(__name__)
+
+#: Name used to group queries that were executed without a name
+UNNAMED_QUERY = "<unnamed>"
+
+#: Timings tracked for each query, in seconds
+TIMINGS = ("wall_time", "server_time", "network_time", "queue_time", "client_time")
+
+
+class QueryProfile(BaseModel):
+    """Timings and sizes for a single query execution
+
+    All times are in seconds.
+    """
+
+    name: str
+    query: str
+    started_at: datetime
+    #: Total time spent in the client's query method
+    wall_time: float
+    #: Server-side time reported in the query response
+    server_time: float
+    #: Time spent sending the request and transferring the response, excluding the
+    #: server-side time
+    network_time: float
+    #: Time spent waiting for a concurrency slot, on retries and on hedging
+    queue_time: float
+    #: Time spent decoding the JSON payload
+    decode_time: float
+    #: Time spent parsing the decoded payload into a QueryResponse
+    parse_time: float
+    row_count: int
+    payload_size: int
+
+    @property
+    def client_time(self) -> float:
+        """Time spent in the client decoding and parsing the response"""
+        return self.decode_time + self.parse_time
+
+
+class QueryProfileSummary(BaseModel):
+    """Rolling statistics for all executions of a query name"""
+
+    name: str
+    count: int
+    p50: Dict[str, float]
+    p95: Dict[str, float]
+    max_row_count: int
+    max_payload_size: int
+    #: Which part of the round-trip dominates the median: server, network or client
+    bound: str
+
+
+class QueryProfiler:
+    """Records per-query timings and logs slow queries
+
+    Statistics are grouped by query name, so queries should be given stable names
+    (e.g. the dashboard step name) to be useful.
+    """
+
+    def __init__(
+        self,
+        slow_query_threshold: Optional[float] = None,
+        window_size: int = 1000,
+        logger: logging.Logger = logger,
+    ) -> None:
+        """Initialize the QueryProfiler
+
+        Args:
+            slow_query_threshold: Queries with a wall time above this number of
+                seconds are written to the slow-query log. If None, nothing is logged.
+            window_size: Number of executions per query name used to compute
+                percentiles
+            logger: Logger that the slow-query log is written to
+
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.window_size = window_size
+        self.logger = logger
+        self._counts: DefaultDict[str, int] = defaultdict(int)
+        self._timings: DefaultDict[str, Dict[str, RollingWindow]] = defaultdict(
+            lambda: {timing: RollingWindow(self.window_size) for timing in TIMINGS}
+        )
+        self._max_row_count: DefaultDict[str, int] = defaultdict(int)
+        self._max_payload_size: DefaultDict[str, int] = defaultdict(int)
+
+    def record(self, profile: QueryProfile) -> None:
+        """Record a query execution
+
+        Args:
+            profile: Timings and sizes of the execution
+
+        """
+        name = profile.name
+        self._counts[name] += 1
+        timings = self._timings[name]
+        for timing in TIMINGS:
+            timings[timing].add(getattr(profile, timing))
+        self._max_row_count[name] = max(self._max_row_count[name], profile.row_count)
+        self._max_payload_size[name] = max(
+            self._max_payload_size[name], profile.payload_size
+        )
+
+        if (
+            self.slow_query_threshold is not None
+            and profile.wall_time > self.slow_query_threshold
+        ):
+            self.logger.warning(
+                f"Slow query name={name} wall_time={profile.wall_time:.3f}"
+                f" server_time={profile.server_time:.3f}"
+                f" network_time={profile.network_time:.3f}"
+                f" queue_time={profile.queue_time:.3f}"
+                f" client_time={profile.client_time:.3f}"
+                f" row_count={profile.row_count}"
+                f" payload_size={profile.payload_size}"
+                f" query={profile.query!r}"
+            )
+
+    def summary(self) -> List[QueryProfileSummary]:
+        """Summarize the recorded executions for each query name
+
+        Returns:
+            list of summaries, sorted by descending p95 wall time
+
+        """
+        summaries = []
+        for name, timings in self._timings.items():
+            p50 = {timing: timings[timing].percentile(50) for timing in TIMINGS}
+            p95 = {timing: timings[timing].percentile(95) for timing in TIMINGS}
+            bound = max(
+                ("server", "network", "client"), key=lambda part: p50[f"{part}_time"]
+            )
+            summaries.append(
+                QueryProfileSummary(
+                    name=name,
+                    count=self._counts[name],
+                    p50=p50,
+                    p95=p95,
+                    max_row_count=self._max_row_count[name],
+                    max_payload_size=self._max_payload_size[name],
+                    bound=bound,
+                )
+            )
+        return sorted(summaries, key=lambda s: s.p95["wall_time"], reverse=True)
+
+    def report(self) -> str:
+        """Format the summary as a plain-text table
+
+        Returns:
+            report with one line per query name
+
+        """
+        header = (
+            f"{'name':<32} {'count':>6} {'wall p50':>9} {'wall p95':>9}"
+            f" {'server':>9} {'network':>9} {'queue':>9} {'client':>9}"
+            f" {'rows':>8} {'bytes':>10}  bound"
+        )
+        lines = [header]
+        for s in self.summary():
+            lines.append(
+                f"{s.name[:32]:<32} {s.count:>6} {s.p50['wall_time']:>9.3f}"
+                f" {s.p95['wall_time']:>9.3f} {s.p50['server_time']:>9.3f}"
+                f" {s.p50['network_time']:>9.3f} {s.p50['queue_time']:>9.3f}"
+                f" {s.p50['client_time']:>9.3f} {s.max_row_count:>8}"
+                f" {s.max_payload_size:>10}  {s.bound}"
+            )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """Discard all recorded executions"""
+        self._counts.clear()
+        self._timings.clear()
+        self._max_row_count.clear()
+        self._max_payload_size.clear()
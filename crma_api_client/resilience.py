@@ -0,0 +1,256 @@
+"""Contains request hedging and circuit breaking to protect against tail latency"""
+
+import asyncio
+from contextlib import contextmanager
+from enum import Enum
+import logging
+import time
+from typing import Awaitable, Callable, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+from pydantic import BaseModel
+
+from .stats import RollingWindow
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is rejected because the circuit breaker is open"""
+
+
+class CircuitState(str, Enum):
+    """State of a circuit breaker"""
+
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+def is_failure(exc: BaseException) -> bool:
+    """Return whether an exception indicates that the instance is unhealthy
+
+    Transport errors (including timeouts) and 5xx responses count as failures. Other
+    errors, e.g. 4xx responses, mean the instance is up and responding.
+
+    Args:
+        exc: Exception raised while sending a request
+
+    Returns:
+        True if the exception should count against the circuit breaker
+
+    """
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Fails requests fast while a Salesforce instance is unhealthy
+
+    After ``failure_threshold`` consecutive failures the circuit opens and requests
+    are rejected with :class:`CircuitOpenError`. Once ``reset_timeout`` seconds have
+    passed, a single probe request is let through. If it succeeds the circuit closes,
+    otherwise it opens again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        logger: logging.Logger = logger,
+    ) -> None:
+        """Initialize the CircuitBreaker
+
+        Args:
+            failure_threshold: Number of consecutive failures that opens the circuit
+            reset_timeout: Number of seconds to wait before probing an open circuit
+            logger: Custom logger instance to use instead of the stdlib
+
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logger
+        self.trip_count = 0
+        self.rejection_count = 0
+        self._state = CircuitState.closed
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state of the circuit"""
+        if (
+            self._state == CircuitState.open
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            return CircuitState.half_open
+        return self._state
+
+    def _trip(self) -> None:
+        """Open the circuit"""
+        self._state = CircuitState.open
+        self._opened_at = time.monotonic()
+        self.trip_count += 1
+        self.logger.warning(
+            f"Circuit breaker opened failures={self._failures}"
+            f" trip_count={self.trip_count}"
+        )
+
+    def before_request(self) -> bool:
+        """Check whether a request may be sent
+
+        Raises:
+            CircuitOpenError: if the circuit is open or a probe is already in flight
+
+        Returns:
+            True if the request is the probe of a half-open circuit
+
+        """
+        state = self.state
+        if state == CircuitState.closed:
+            return False
+        if state == CircuitState.half_open and not self._probe_in_flight:
+            self._state = CircuitState.half_open
+            self._probe_in_flight = True
+            return True
+        self.rejection_count += 1
+        raise CircuitOpenError("Circuit breaker is open; failing fast")
+
+    def record_success(self) -> None:
+        """Record a successful request"""
+        if self._state != CircuitState.closed:
+            self.logger.info("Circuit breaker closed")
+        self._state = CircuitState.closed
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Record a failed request"""
+        self._failures += 1
+        self._probe_in_flight = False
+        if (
+            self._state == CircuitState.half_open
+            or self._failures >= self.failure_threshold
+        ):
+            self._trip()
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """Context manager that checks the circuit and records the request outcome
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+
+        """
+        probe = self.before_request()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # A cancelled request (e.g. the losing side of a hedge) says nothing about
+            # the health of the instance. If it was the probe, another one may be sent.
+            if probe:
+                self._probe_in_flight = False
+            raise
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        else:
+            self.record_success()
+
+
+class HedgePolicy(BaseModel):
+    """Policy for sending hedged requests
+
+    A hedged request is a second attempt that is sent when the first one has not
+    completed after a delay. Whichever attempt finishes first wins and the other one
+    is cancelled. The delay adapts to the observed latency of each operation.
+    """
+
+    #: Latency percentile used as the hedge delay
+    percentile: float = 95.0
+    #: Number of latency samples required before the percentile is used
+    min_samples: int = 20
+    #: Hedge delay used until enough samples have been collected, in seconds
+    initial_delay: float = 1.0
+    #: Lower bound for the hedge delay, in seconds
+    min_delay: float = 0.05
+    #: Upper bound for the hedge delay, in seconds
+    max_delay: float = 10.0
+    #: Number of latency samples to keep per operation
+    window_size: int = 1000
+    #: Whether to hedge queries in addition to dataset version reads
+    queries: bool = False
+
+    def delay(self, latencies: RollingWindow) -> float:
+        """Compute the hedge delay for an operation
+
+        Args:
+            latencies: Recent latencies for the operation, in seconds
+
+        Returns:
+            number of seconds to wait before sending the hedged request
+
+        """
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return min(
+            max(latencies.percentile(self.percentile), self.min_delay), self.max_delay
+        )
+
+
+class ResilienceStats(BaseModel):
+    """Counters reported by the client for hedging and circuit breaking"""
+
+    hedges_sent: int = 0
+    hedges_won: int = 0
+    circuit_trips: int = 0
+    circuit_rejections: int = 0
+    circuit_state: Optional[CircuitState] = None
+
+
+async def hedge(send: Callable[[], Awaitable[T]], delay: float) -> Tuple[T, bool, bool]:
+    """Send a request and hedge it with a second attempt after a delay
+
+    Args:
+        send: Function that starts a new attempt
+        delay: Number of seconds to wait for the first attempt before hedging
+
+    Returns:
+        tuple of (result, whether a hedge was sent, whether the hedge won)
+
+    """
+    primary = asyncio.ensure_future(send())
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result(), False, False
+
+        secondary = asyncio.ensure_future(send())
+        tasks.append(secondary)
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), True, task is secondary
+                error = task.exception()
+
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
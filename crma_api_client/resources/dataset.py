@@ -172,3 +172,49 @@ class DatasetVersionsResponse(CRMAModel):
 
     url: str
     versions: List[DatasetVersion]
+
+
+class Folder(CRMAModel):
+    """Folder (app) that contains an asset"""
+
+    id: str
+    label: Optional[str]
+    name: Optional[str]
+    url: Optional[str]
+
+
+class DatasetSummary(CRMAModel):
+    """Dataset model returned by the dataset collection resource
+
+    Only the ID is required, so that pages requested with a reduced set of fields
+    can still be parsed.
+
+    See https://developer.salesforce.com/docs/atlas.en-us.bi_dev_guide_rest.meta/bi_dev_guide_rest/bi_responses_dataset.htm
+    """
+
+    id: str
+    name: Optional[str]
+    label: Optional[str]
+    type: Optional[str]
+    url: Optional[str]
+    created_by: Optional[User]
+    created_date: Optional[datetime]
+    last_modified_by: Optional[User]
+    last_modified_date: Optional[datetime]
+    last_accessed_date: Optional[datetime]
+    current_version_id: Optional[str]
+    current_version_url: Optional[str]
+    versions_url: Optional[str]
+    folder: Optional[Folder]
+
+
+class DatasetsResponse(CRMAModel):
+    """Response model for a page of datasets
+
+    See https://developer.salesforce.com/docs/atlas.en-us.bi_dev_guide_rest.meta/bi_dev_guide_rest/bi_responses_dataset_collection.htm
+    """
+
+    datasets: List[DatasetSummary]
+    next_page_url: Optional[str]
+    total_size: Optional[int]
+    url: Optional[str]
@@ -3,9 +3,9 @@
 
 from enum import Enum
 from functools import cached_property
-from typing import Any, Dict, List, Literal, Union
+from typing import Any, Callable, Dict, List, Literal, Optional, Sequence, Union
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing_extensions import Annotated
 
 from .util import to_camel
@@ -35,6 +35,99 @@ class ProjectionField(BaseModel):
         keep_untouched = (cached_property,)
 
 
+def _identity(value: Any) -> Any:
+    """Return a column value unchanged"""
+    return value
+
+
+def _to_number(value: Any) -> Any:
+    """Convert a numeric column value, leaving nulls and numbers untouched"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return float(value)
+
+
+def _to_string(value: Any) -> Any:
+    """Convert a string column value, leaving nulls untouched"""
+    return value if value is None else str(value)
+
+
+#: Column value converters by projection field type
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "numeric": _to_number,
+    "string": _to_string,
+}
+
+
+class ResultSchema:
+    """Precomputed structure of a query result
+
+    Built once per query shape so that repeated queries don't have to walk the
+    lineage again.
+    """
+
+    def __init__(self, fields: List[ProjectionField]) -> None:
+        """Initialize the ResultSchema
+
+        Args:
+            fields: Fields projected in the query result
+
+        """
+        self.fields = fields
+        #: Field names (without stream reference) in projection order
+        self.names = [f.name for f in fields]
+        #: Mapping of field ID to field name
+        self.names_by_id = {f.id: f.name for f in fields}
+        #: Mapping of field name to its index in the projection
+        self.indexes = {name: i for i, name in enumerate(self.names)}
+        #: Mapping of field name to the converter for its values
+        self.converters = {f.name: CONVERTERS.get(f.type, _identity) for f in fields}
+
+    def matches(self, record: Dict[str, Any]) -> bool:
+        """Return whether a record has exactly the fields in this schema
+
+        Args:
+            record: Record from a query result
+
+        Returns:
+            True if the record's keys are the field names
+
+        """
+        return len(record) == len(self.indexes) and all(
+            key in self.indexes for key in record
+        )
+
+    def convert(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert the values of a record according to the field types
+
+        Args:
+            record: Record from a query result
+
+        Returns:
+            new record with converted values
+
+        """
+        return {
+            key: self.converters.get(key, _identity)(value)
+            for key, value in record.items()
+        }
+
+    def columns(self, records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """Pivot records into converted columns
+
+        Args:
+            records: Records from a query result
+
+        Returns:
+            mapping of field name to column values
+
+        """
+        return {
+            name: [self.converters[name](record.get(name)) for record in records]
+            for name in self.names
+        }
+
+
 class LineageProjection(BaseModel):
     """Field projection metadata container"""
 
@@ -79,6 +172,25 @@ class QueryResults(BaseModel):
     metadata: List[QueryResultsMetadata]
     records: List[Dict[str, Any]]
 
+    def column(self, name: str) -> Sequence[Any]:
+        """Get the values of a field in every record
+
+        Args:
+            name: Field name
+
+        Returns:
+            column values, with None for records that don't have the field
+
+        """
+        return [record.get(name) for record in self.records]
+
+    def close(self) -> None:
+        """Release the resources held by the results
+
+        In-memory results don't hold any, but results spilled to disk delete their
+        spill file.
+        """
+
 
 class QueryResponse(BaseModel):
     """Response model for the query resource
@@ -92,12 +204,17 @@ class QueryResponse(BaseModel):
     query: str
     response_time: int
 
+    _schema: Optional[ResultSchema] = PrivateAttr(default=None)
+
     @cached_property
     def fields(self) -> List[ProjectionField]:
         """Return the fields from the query response metadata
 
         This assumes there is only one metadata object and one lineage object.
         """
+        if self._schema is not None:
+            return self._schema.fields
+
         lineage = self.results.metadata[0].lineage
         if isinstance(lineage, UnionLineage):
             # Unions require that all inputs have the same structure, so we only
@@ -108,6 +225,34 @@ class QueryResponse(BaseModel):
 
         return [p.field for p in projections]
 
+    @property
+    def result_schema(self) -> ResultSchema:
+        """Return the precomputed structure of the query result"""
+        if self._schema is None:
+            self._schema = ResultSchema(self.fields)
+        return self._schema
+
+    def attach_schema(self, schema: ResultSchema) -> None:
+        """Use a cached schema instead of walking the lineage
+
+        Args:
+            schema: Schema of a previous result with the same shape
+
+        """
+        self._schema = schema
+
+    def close(self) -> None:
+        """Release the resources held by the results, e.g. a spill file"""
+        self.results.close()
+
+    def __enter__(self) -> "QueryResponse":
+        """Enter the response context"""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Exit the response context, closing the results"""
+        self.close()
+
     class Config:
         """Model configuration"""
 
@@ -0,0 +1,153 @@
+"""Contains the request scheduler used to prioritize API requests"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import IntEnum
+import itertools
+import time
+from typing import AsyncIterator, List, Optional
+
+
+class RequestPriority(IntEnum):
+    """Priority class of a request. Lower values are admitted first."""
+
+    interactive = 0
+    default = 1
+    batch = 2
+
+
+@dataclass(eq=False)
+class _Waiter:
+    """Request waiting for a concurrency slot"""
+
+    priority: RequestPriority
+    enqueued_at: float
+    sequence: int
+    future: "asyncio.Future[None]"
+
+
+class PriorityScheduler:
+    """Admits requests from a priority queue under a global concurrency budget
+
+    Waiting requests are admitted in order of their effective priority, which is the
+    priority class minus the number of ``aging_interval`` periods the request has been
+    waiting. This means a batch request that has been waiting long enough will
+    eventually be admitted ahead of newer interactive requests.
+    """
+
+    def __init__(
+        self, max_concurrency: Optional[int] = None, aging_interval: float = 5.0
+    ) -> None:
+        """Initialize the PriorityScheduler
+
+        Args:
+            max_concurrency: Maximum number of requests in flight at once. If None,
+                requests are never queued.
+            aging_interval: Number of seconds a request has to wait before it is
+                promoted by one priority class
+
+        Raises:
+            ValueError: if max_concurrency or aging_interval is out of range
+
+        """
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if aging_interval <= 0:
+            raise ValueError("aging_interval must be positive")
+        self.max_concurrency = max_concurrency
+        self.aging_interval = aging_interval
+        self._active = 0
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+
+    @property
+    def active(self) -> int:
+        """Number of requests currently holding a slot"""
+        return self._active
+
+    @property
+    def pending(self) -> int:
+        """Number of requests waiting for a slot"""
+        return len(self._waiters)
+
+    def _has_capacity(self) -> bool:
+        """Return whether another request can be admitted right now"""
+        return self.max_concurrency is None or self._active < self.max_concurrency
+
+    def _next_waiter(self) -> _Waiter:
+        """Pop the waiter with the best effective priority
+
+        Returns:
+            waiter to admit next
+
+        """
+        now = time.monotonic()
+        best = min(
+            self._waiters,
+            key=lambda w: (
+                w.priority - (now - w.enqueued_at) / self.aging_interval,
+                w.sequence,
+            ),
+        )
+        self._waiters.remove(best)
+        return best
+
+    def _wake(self) -> None:
+        """Admit waiters while there is spare capacity"""
+        while self._waiters and self._has_capacity():
+            waiter = self._next_waiter()
+            if not waiter.future.done():
+                self._active += 1
+                waiter.future.set_result(None)
+
+    async def acquire(
+        self, priority: RequestPriority = RequestPriority.default
+    ) -> None:
+        """Wait until a slot is available for a request with the given priority
+
+        Args:
+            priority: Priority class of the request
+
+        """
+        if not self._waiters and self._has_capacity():
+            self._active += 1
+            return
+
+        waiter = _Waiter(
+            priority=priority,
+            enqueued_at=time.monotonic(),
+            sequence=next(self._sequence),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # The slot was granted right before cancellation, so hand it on
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Release a slot and admit the next waiting request"""
+        self._active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(
+        self, priority: RequestPriority = RequestPriority.default
+    ) -> AsyncIterator[None]:
+        """Context manager that holds a slot for the duration of a request
+
+        Args:
+            priority: Priority class of the request
+
+        """
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
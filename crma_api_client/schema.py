@@ -0,0 +1,175 @@
+"""Contains the query result schema cache and the SAQL projection validator"""
+
+from collections import OrderedDict
+import hashlib
+from itertools import chain
+import re
+from typing import Optional, Set
+
+from .resources.dataset import DatasetXmd
+from .resources.query import QueryLanguage, QueryResponse, ResultSchema
+
+#: Pattern for double-quoted SAQL string literals
+STRING_LITERAL_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+#: Pattern for single-quoted SAQL identifiers, optionally preceded by "as"
+QUOTED_IDENTIFIER_PATTERN = re.compile(r"(\bas\s+)?'((?:[^'\\]|\\.)*)'", re.IGNORECASE)
+
+#: Pattern for unquoted stream-qualified identifiers, e.g. q.Category
+QUALIFIED_IDENTIFIER_PATTERN = re.compile(r"\b[A-Za-z_]\w*\.([A-Za-z_]\w*)")
+
+#: Pattern for unquoted aliases, e.g. "as Category"
+UNQUOTED_ALIAS_PATTERN = re.compile(r"\bas\s+([A-Za-z_]\w*)", re.IGNORECASE)
+
+
+class SchemaValidationError(ValueError):
+    """Raised when a query references fields that don't exist in the dataset"""
+
+
+def query_fingerprint(
+    query: str, query_language: QueryLanguage = QueryLanguage.saql
+) -> str:
+    """Compute a fingerprint that identifies the shape of a query result
+
+    Args:
+        query: Query string
+        query_language: Query language
+
+    Returns:
+        hex digest of the normalized query
+
+    """
+    normalized = " ".join(query.split())
+    return hashlib.sha1(
+        f"{query_language.value}\0{normalized}".encode(), usedforsecurity=False
+    ).hexdigest()
+
+
+class SchemaCache:
+    """LRU cache of query result schemas keyed by query fingerprint"""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        """Initialize the SchemaCache
+
+        Args:
+            maxsize: Maximum number of schemas to keep
+
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._schemas: "OrderedDict[str, ResultSchema]" = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of cached schemas"""
+        return len(self._schemas)
+
+    def get(self, fingerprint: str) -> Optional[ResultSchema]:
+        """Get a cached schema
+
+        Args:
+            fingerprint: Query fingerprint
+
+        Returns:
+            the schema, or None if it isn't cached
+
+        """
+        schema = self._schemas.get(fingerprint)
+        if schema is not None:
+            self._schemas.move_to_end(fingerprint)
+        return schema
+
+    def put(self, fingerprint: str, schema: ResultSchema) -> None:
+        """Cache a schema
+
+        Args:
+            fingerprint: Query fingerprint
+            schema: Schema of the query result
+
+        """
+        self._schemas[fingerprint] = schema
+        self._schemas.move_to_end(fingerprint)
+        while len(self._schemas) > self.maxsize:
+            self._schemas.popitem(last=False)
+
+    def apply(self, fingerprint: str, response: QueryResponse) -> ResultSchema:
+        """Attach the cached schema to a response, caching a new one on a miss
+
+        A cached schema is only reused if it matches the fields of the first record,
+        in case the dataset has changed since it was cached.
+
+        Args:
+            fingerprint: Query fingerprint
+            response: Response of the query
+
+        Returns:
+            the schema attached to the response
+
+        """
+        schema = self.get(fingerprint)
+        records = response.results.records
+        if schema is not None and (not records or schema.matches(records[0])):
+            self.hits += 1
+            response.attach_schema(schema)
+            return schema
+
+        self.misses += 1
+        schema = response.result_schema
+        self.put(fingerprint, schema)
+        return schema
+
+
+def dataset_fields(xmd: DatasetXmd) -> Set[str]:
+    """Get the names of all fields defined in the extended metadata of a dataset
+
+    Args:
+        xmd: Extended metadata of the dataset
+
+    Returns:
+        set of field names, including derived and date fields
+
+    """
+    fields = {d.field for d in chain(xmd.dimensions, xmd.derived_dimensions)}
+    fields.update(m.field for m in chain(xmd.measures, xmd.derived_measures))
+    for date in xmd.dates:
+        fields.add(date.alias)
+        fields.update(value for value in date.fields.dict().values() if value)
+    return fields
+
+
+def validate_query(query: str, xmd: DatasetXmd) -> None:
+    """Check that a SAQL query only references fields that exist in the dataset
+
+    Single-quoted identifiers and stream-qualified names are checked against the
+    dimensions, measures and date fields of the dataset. Names introduced with ``as``
+    are treated as aliases and are allowed anywhere in the query.
+
+    Args:
+        query: SAQL query string
+        xmd: Extended metadata of the dataset the query loads
+
+    Raises:
+        SchemaValidationError: if the query references unknown fields
+
+    """
+    query = STRING_LITERAL_PATTERN.sub('""', query)
+    aliases = set()
+    referenced = set()
+    for alias_prefix, identifier in QUOTED_IDENTIFIER_PATTERN.findall(query):
+        identifier = identifier.replace("\\'", "'")
+        if alias_prefix:
+            aliases.add(identifier)
+        else:
+            referenced.add(identifier)
+
+    # Quoted identifiers may contain dots, e.g. 'Account.Name', so remove them before
+    # looking for unquoted names
+    query = QUOTED_IDENTIFIER_PATTERN.sub("''", query)
+    aliases.update(UNQUOTED_ALIAS_PATTERN.findall(query))
+    referenced.update(QUALIFIED_IDENTIFIER_PATTERN.findall(query))
+
+    unknown = referenced - aliases - dataset_fields(xmd) - {"*"}
+    if unknown:
+        raise SchemaValidationError(
+            f"Query references fields that are not in the dataset: {sorted(unknown)}"
+        )
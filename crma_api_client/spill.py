@@ -0,0 +1,760 @@
+"""Contains the on-disk spill store for oversized query results
+
+The query payload is decoded from a file one record at a time, and the records are
+written in row groups, column by column, to a local file that is then memory-mapped.
+The result can be sliced, iterated and accessed by column without keeping every
+record in memory. Numeric columns are stored as packed 64-bit arrays and all other
+columns, including columns that mix integers and floats, as JSON-encoded values with
+an offsets array, so that every record reads back exactly as it was decoded.
+
+File layout: an 8-byte magic string, the row groups with their column segments, each
+aligned to 8 bytes, then the JSON footer describing the segments, the footer length
+as an unsigned 64-bit integer and the magic string again.
+"""
+
+from array import array
+from bisect import bisect_right
+from codecs import getincrementaldecoder
+from collections.abc import Sequence
+from itertools import islice
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    IO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    overload,
+    Tuple,
+    Union,
+)
+import weakref
+
+from pydantic import PrivateAttr
+
+from .resources.query import QueryResponse, QueryResults, QueryResultsMetadata
+
+#: Magic string at the start and end of every spill file
+MAGIC = b"CRMASPL1"
+
+#: Struct format of the footer length
+FOOTER_LENGTH_FORMAT = "<Q"
+
+#: Alignment of column segments, in bytes
+ALIGNMENT = 8
+
+#: Number of records buffered in memory and written to disk together
+ROW_GROUP_SIZE = 65536
+
+#: Size of the chunks read from a payload file, in bytes
+READ_CHUNK_SIZE = 1 << 20
+
+#: array and memoryview typecodes for numeric encodings
+NUMERIC_FORMATS = {"int64": "q", "float64": "d"}
+
+#: Characters skipped between records in the records array of a payload
+_SEPARATORS = " \t\r\n,"
+
+
+class _Missing:
+    """Marker for a field that is absent from a record"""
+
+    def __repr__(self) -> str:
+        """Return the representation of the marker"""
+        return "MISSING"
+
+
+MISSING: Any = _Missing()
+
+
+def _column_encoding(values: List[Any]) -> str:
+    """Choose the encoding for a column chunk
+
+    Columns that mix integers and floats are JSON-encoded, so that integers aren't
+    read back as floats.
+
+    Args:
+        values: Column values, with MISSING for absent fields
+
+    Returns:
+        one of int64, float64 or json
+
+    """
+    encoding: Optional[str] = None
+    for value in values:
+        if value is None or value is MISSING:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return "json"
+        if isinstance(value, float):
+            value_encoding = "float64"
+        elif -(2**63) <= value < 2**63:
+            value_encoding = "int64"
+        else:
+            return "json"
+        if encoding is None:
+            encoding = value_encoding
+        elif encoding != value_encoding:
+            return "json"
+    return encoding or "int64"
+
+
+class _SegmentWriter:
+    """Writes aligned segments to a spill file"""
+
+    def __init__(self, f: IO[bytes]) -> None:
+        """Initialize the _SegmentWriter
+
+        Args:
+            f: File to write the segments to
+
+        """
+        self._f = f
+        self._position = f.tell()
+
+    def write(self, data: bytes) -> Tuple[int, int]:
+        """Write a segment
+
+        Args:
+            data: Segment bytes
+
+        Returns:
+            tuple of (offset, length) of the segment in the file
+
+        """
+        offset = self._position
+        padding = -len(data) % ALIGNMENT
+        self._f.write(data)
+        self._f.write(b"\0" * padding)
+        self._position += len(data) + padding
+        return offset, len(data)
+
+    def write_column(self, values: List[Any]) -> Dict[str, Any]:
+        """Write the segments of a column chunk
+
+        Args:
+            values: Column values, with MISSING for absent fields
+
+        Returns:
+            description of the chunk with its encoding and segments
+
+        """
+        encoding = _column_encoding(values)
+        chunk: Dict[str, Any] = {"encoding": encoding}
+        if any(value is MISSING for value in values):
+            chunk["missing"] = self.write(bytes(value is MISSING for value in values))
+        if encoding in NUMERIC_FORMATS:
+            chunk["data"] = self.write(
+                array(
+                    NUMERIC_FORMATS[encoding],
+                    (
+                        0 if value is None or value is MISSING else value
+                        for value in values
+                    ),
+                ).tobytes()
+            )
+            if any(value is None for value in values):
+                chunk["nulls"] = self.write(bytes(value is None for value in values))
+        else:
+            encoded = [
+                b"" if value is MISSING else json.dumps(value).encode()
+                for value in values
+            ]
+            offsets = [0]
+            for item in encoded:
+                offsets.append(offsets[-1] + len(item))
+            chunk["offsets"] = self.write(array("q", offsets).tobytes())
+            chunk["data"] = self.write(b"".join(encoded))
+        return chunk
+
+
+def write_spill_file(path: str, records: Iterable[Dict[str, Any]]) -> None:
+    """Write records to a columnar spill file
+
+    Only one row group of records is held in memory at a time.
+
+    Args:
+        path: Path of the file to write
+        records: Records to write
+
+    """
+    names: Dict[str, None] = {}
+    groups = []
+    row_count = 0
+    iterator = iter(records)
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        writer = _SegmentWriter(f)
+        while True:
+            group = list(islice(iterator, ROW_GROUP_SIZE))
+            if not group:
+                break
+            group_names: Dict[str, None] = {}
+            for record in group:
+                group_names.update(dict.fromkeys(record))
+            names.update(group_names)
+            columns = {}
+            for name in group_names:
+                values = [record.get(name, MISSING) for record in group]
+                columns[name] = writer.write_column(values)
+                del values
+            groups.append({"row_count": len(group), "columns": columns})
+            row_count += len(group)
+            del group
+
+        footer = json.dumps(
+            {"row_count": row_count, "names": list(names), "groups": groups}
+        ).encode()
+        f.write(footer)
+        f.write(struct.pack(FOOTER_LENGTH_FORMAT, len(footer)))
+        f.write(MAGIC)
+
+
+class _ColumnChunk:
+    """Values of a column in one row group, backed by memory-mapped buffers"""
+
+    def __init__(self, buffer: memoryview, chunk: Dict[str, Any]) -> None:
+        """Initialize the _ColumnChunk
+
+        Args:
+            buffer: Memory-mapped spill file
+            chunk: Chunk description from the spill file footer
+
+        """
+        self.encoding: str = chunk["encoding"]
+
+        def segment(key: str) -> Optional[memoryview]:
+            if key not in chunk:
+                return None
+            offset, length = chunk[key]
+            return buffer[offset : offset + length]
+
+        self._missing = segment("missing")
+        self._nulls = segment("nulls")
+        self._data = segment("data")
+        self._offsets = segment("offsets")
+        if self.encoding in NUMERIC_FORMATS:
+            self._data = self._data.cast(NUMERIC_FORMATS[self.encoding])
+        else:
+            self._offsets = self._offsets.cast("q")
+
+    def get(self, i: int) -> Any:
+        """Read the value at a row index within the chunk
+
+        Args:
+            i: Row index within the chunk
+
+        Returns:
+            the value, or MISSING if the record doesn't have the field
+
+        """
+        if self._missing is not None and self._missing[i]:
+            return MISSING
+        if self._offsets is not None:
+            return json.loads(
+                bytes(self._data[self._offsets[i] : self._offsets[i + 1]])
+            )
+        if self._nulls is not None and self._nulls[i]:
+            return None
+        return self._data[i]
+
+    def release(self) -> None:
+        """Release the views on the memory-mapped buffer"""
+        for view in (self._missing, self._nulls, self._data, self._offsets):
+            if view is not None:
+                view.release()
+
+
+class _SpillFile:
+    """Memory-mapped spill file, deleted once it is closed or garbage collected"""
+
+    def __init__(self, path: str) -> None:
+        """Initialize the _SpillFile by memory-mapping a spill file
+
+        Args:
+            path: Path to the spill file
+
+        Raises:
+            ValueError: if the file is not a spill file
+
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a spill file path={path}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._finalizer = weakref.finalize(self, _remove_spill_file, self._mmap, path)
+        self._buffer = memoryview(self._mmap)
+
+        trailer_start = len(self._buffer) - struct.calcsize(FOOTER_LENGTH_FORMAT)
+        trailer_start -= len(MAGIC)
+        if trailer_start < len(MAGIC) or self._buffer[-len(MAGIC) :] != MAGIC:
+            raise ValueError(f"Truncated spill file path={path}")
+        (footer_length,) = struct.unpack_from(
+            FOOTER_LENGTH_FORMAT, self._buffer, trailer_start
+        )
+        footer = json.loads(
+            bytes(self._buffer[trailer_start - footer_length : trailer_start])
+        )
+
+        self.row_count: int = footer["row_count"]
+        self.names: List[str] = footer["names"]
+        #: Index of the first row of each row group, followed by the row count
+        self.group_starts = [0]
+        self.chunks: Dict[str, List[Optional[_ColumnChunk]]] = {
+            name: [] for name in self.names
+        }
+        for group in footer["groups"]:
+            self.group_starts.append(self.group_starts[-1] + group["row_count"])
+            for name in self.names:
+                chunk = group["columns"].get(name)
+                self.chunks[name].append(
+                    None if chunk is None else _ColumnChunk(self._buffer, chunk)
+                )
+
+    def close(self) -> None:
+        """Release the memory map and delete the spill file"""
+        if not self._finalizer.alive:
+            return
+        for chunks in self.chunks.values():
+            for chunk in chunks:
+                if chunk is not None:
+                    chunk.release()
+        self._buffer.release()
+        self._finalizer()
+
+
+def _remove_spill_file(buffer: mmap.mmap, path: str) -> None:
+    """Close the memory map of a spill file and delete the file
+
+    Args:
+        buffer: Memory map of the file
+        path: Path to the file
+
+    """
+    try:
+        buffer.close()
+    except BufferError:
+        # A view is still referenced, so the map is closed once it is collected
+        pass
+    _remove_file(path)
+
+
+def _remove_file(path: str) -> None:
+    """Delete a file if it still exists
+
+    Args:
+        path: Path to the file
+
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _normalize_index(index: int, length: int) -> int:
+    """Convert a possibly negative index to a row index
+
+    Args:
+        index: Index into a sequence
+        length: Length of the sequence
+
+    Raises:
+        IndexError: if the index is out of range
+
+    Returns:
+        non-negative row index
+
+    """
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError("spill index out of range")
+    return index
+
+
+class SpilledColumn(Sequence):
+    """Read-only column of a spill file
+
+    Records that don't have the field read as None, like ``record.get(name)``.
+    """
+
+    def __init__(self, spill_file: _SpillFile, name: str) -> None:
+        """Initialize the SpilledColumn
+
+        Args:
+            spill_file: Spill file the column is read from
+            name: Field name
+
+        """
+        self.name = name
+        self._file = spill_file
+        self._chunks = spill_file.chunks.get(name) or [None] * (
+            len(spill_file.group_starts) - 1
+        )
+
+    def __len__(self) -> int:
+        """Return the number of rows"""
+        return self._file.row_count
+
+    def _get(self, i: int) -> Any:
+        """Read the value at a row index, or MISSING if the record lacks the field"""
+        starts = self._file.group_starts
+        group = bisect_right(starts, i) - 1
+        chunk = self._chunks[group]
+        if chunk is None:
+            return MISSING
+        return chunk.get(i - starts[group])
+
+    def _iter(self) -> Iterator[Any]:
+        """Iterate over the values, with MISSING for records that lack the field"""
+        starts = self._file.group_starts
+        for group, chunk in enumerate(self._chunks):
+            count = starts[group + 1] - starts[group]
+            if chunk is None:
+                yield from (MISSING for _ in range(count))
+            else:
+                yield from (chunk.get(i) for i in range(count))
+
+    @overload
+    def __getitem__(self, index: int) -> Any:  # noqa: D105
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Any]:  # noqa: D105
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        """Read a value or a list of values
+
+        Args:
+            index: Row index or slice
+
+        Returns:
+            the value, or a list of values for a slice
+
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._file.row_count))]
+        value = self._get(_normalize_index(index, self._file.row_count))
+        return None if value is MISSING else value
+
+    def __iter__(self) -> Iterator[Any]:
+        """Iterate over the values in the column"""
+        for value in self._iter():
+            yield None if value is MISSING else value
+
+
+class SpilledRecords(Sequence):
+    """Read-only list of records that are read from a spill file on access"""
+
+    def __init__(self, spill_file: _SpillFile) -> None:
+        """Initialize the SpilledRecords
+
+        Args:
+            spill_file: Spill file the records are read from
+
+        """
+        self._file = spill_file
+        self._columns = [SpilledColumn(spill_file, name) for name in spill_file.names]
+
+    def __len__(self) -> int:
+        """Return the number of records"""
+        return self._file.row_count
+
+    def _record(self, values: Iterable[Any]) -> Dict[str, Any]:
+        """Build a record from column values, leaving out absent fields"""
+        return {
+            column.name: value
+            for column, value in zip(self._columns, values)
+            if value is not MISSING
+        }
+
+    @overload
+    def __getitem__(self, index: int) -> Dict[str, Any]:  # noqa: D105
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[Dict[str, Any]]:  # noqa: D105
+        ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        """Read a record or a list of records
+
+        Args:
+            index: Row index or slice
+
+        Returns:
+            the record, or a list of records for a slice
+
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._file.row_count))]
+        i = _normalize_index(index, self._file.row_count)
+        return self._record(column._get(i) for column in self._columns)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the records"""
+        if not self._columns:
+            # Records without any fields still count as rows
+            for _ in range(self._file.row_count):
+                yield {}
+            return
+        for values in zip(*(column._iter() for column in self._columns)):
+            yield self._record(values)
+
+    def __eq__(self, other: object) -> bool:
+        """Compare the records with another sequence of records"""
+        if isinstance(other, (list, SpilledRecords)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+
+class SpilledQueryResults(QueryResults):
+    """Query results whose records are stored in a memory-mapped spill file
+
+    ``records`` is a :class:`SpilledRecords` sequence that supports indexing, slicing
+    and iteration. The spill file is deleted when the results are closed or garbage
+    collected.
+    """
+
+    _file: _SpillFile = PrivateAttr()
+
+    @classmethod
+    def open(
+        cls, metadata: List[QueryResultsMetadata], path: str
+    ) -> "SpilledQueryResults":
+        """Create the results by memory-mapping a spill file
+
+        Args:
+            metadata: Query results metadata
+            path: Path to the spill file, which the results take ownership of
+
+        Returns:
+            the results
+
+        """
+        spill_file = _SpillFile(path)
+        results = cls.construct(metadata=metadata, records=SpilledRecords(spill_file))
+        results._file = spill_file
+        return results
+
+    @property
+    def path(self) -> str:
+        """Path to the spill file"""
+        return self._file.path
+
+    def column(self, name: str) -> SpilledColumn:
+        """Get the values of a field in every record
+
+        Args:
+            name: Field name
+
+        Returns:
+            column read from the spill file, with None for records that don't have
+            the field
+
+        """
+        return SpilledColumn(self._file, name)
+
+    def close(self) -> None:
+        """Release the memory map and delete the spill file"""
+        self._file.close()
+
+
+def spill_records(
+    metadata: List[QueryResultsMetadata],
+    records: Iterable[Dict[str, Any]],
+    directory: Optional[str] = None,
+) -> SpilledQueryResults:
+    """Write records to a new spill file and open them as query results
+
+    Args:
+        metadata: Query results metadata
+        records: Records to write
+        directory: Directory for the spill file. Defaults to the system temporary
+            directory.
+
+    Returns:
+        the results backed by the spill file
+
+    """
+    fd, path = tempfile.mkstemp(prefix="crma-spill-", suffix=".bin", dir=directory)
+    os.close(fd)
+    try:
+        write_spill_file(path, records)
+        return SpilledQueryResults.open(metadata, path)
+    except BaseException:
+        _remove_file(path)
+        raise
+
+
+class _PayloadReader:
+    """Decodes a query payload from a file, one record at a time
+
+    Everything but the records array at ``results.records`` is collected into a
+    skeleton document, in which the array is empty.
+    """
+
+    def __init__(self, f: IO[bytes]) -> None:
+        """Initialize the _PayloadReader
+
+        Args:
+            f: Binary file positioned at the start of the payload
+
+        """
+        self._f = f
+        self._text = getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self._skeleton: List[str] = []
+
+    @property
+    def skeleton(self) -> str:
+        """JSON document of the payload without records, once they have been read"""
+        return "".join(self._skeleton)
+
+    def _read(self) -> str:
+        """Read and decode the next chunk, returning an empty string at the end"""
+        while True:
+            chunk = self._f.read(READ_CHUNK_SIZE)
+            text = self._text.decode(chunk, final=not chunk)
+            if text or not chunk:
+                return text
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over the records in the payload
+
+        Yields:
+            records in the order of the payload
+
+        """
+        # Each entry is [is object, expecting a key, last key] for an open container
+        stack: List[List[Any]] = []
+        in_string = escape = False
+        key: Optional[List[str]] = None
+        buffer = ""
+        pos = start = 0
+        while True:
+            if pos >= len(buffer):
+                self._skeleton.append(buffer[start:])
+                buffer = self._read()
+                pos = start = 0
+                if not buffer:
+                    return
+            c = buffer[pos]
+            pos += 1
+            if in_string:
+                if escape:
+                    escape = False
+                elif c == "\\":
+                    escape = True
+                elif c == '"':
+                    in_string = False
+                    if key is not None:
+                        stack[-1][2] = json.loads('"' + "".join(key) + '"')
+                        key = None
+                        continue
+                if key is not None:
+                    key.append(c)
+            elif c == '"':
+                in_string = True
+                if stack and stack[-1][0] and stack[-1][1]:
+                    key = []
+            elif c == ":":
+                stack[-1][1] = False
+            elif c == ",":
+                stack[-1][1] = stack[-1][0]
+            elif c in "{[":
+                if (
+                    c == "["
+                    and len(stack) == 2
+                    and stack[0][2] == "results"
+                    and stack[1][2] == "records"
+                ):
+                    self._skeleton.append(buffer[start:pos] + "]")
+                    buffer, pos = yield from self._records(buffer, pos)
+                    start = pos
+                else:
+                    stack.append([c == "{", c == "{", None])
+            elif c in "}]":
+                stack.pop()
+
+    def _records(
+        self, buffer: str, pos: int
+    ) -> Generator[Dict[str, Any], None, Tuple[str, int]]:
+        """Decode the elements of the records array
+
+        Args:
+            buffer: Decoded text
+            pos: Position after the opening bracket of the array
+
+        Raises:
+            ValueError: if the payload ends inside the array
+
+        Yields:
+            records in the array
+
+        Returns:
+            tuple of (buffer, position after the closing bracket of the array)
+
+        """
+        while True:
+            while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+                pos += 1
+            if pos == len(buffer):
+                buffer, pos = self._read(), 0
+                if not buffer:
+                    raise ValueError("Query payload ended inside the records array")
+                continue
+            if buffer[pos] == "]":
+                return buffer, pos + 1
+            try:
+                record, pos = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The record continues in the next chunk
+                more = self._read()
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield record
+
+
+def parse_spilled_query_response(
+    f: IO[bytes], directory: Optional[str] = None
+) -> QueryResponse:
+    """Parse a query payload from a file, spilling its records to disk
+
+    The records are decoded one at a time and written to a spill file, so neither the
+    payload nor the records are ever held in memory at once.
+
+    Args:
+        f: Binary file positioned at the start of the payload
+        directory: Directory for the spill file. Defaults to the system temporary
+            directory.
+
+    Returns:
+        query response whose results are a :class:`SpilledQueryResults`
+
+    """
+    reader = _PayloadReader(f)
+    fd, path = tempfile.mkstemp(prefix="crma-spill-", suffix=".bin", dir=directory)
+    os.close(fd)
+    try:
+        write_spill_file(path, reader.records())
+        response = QueryResponse.parse_raw(reader.skeleton)
+        response.results = SpilledQueryResults.open(response.results.metadata, path)
+    except BaseException:
+        _remove_file(path)
+        raise
+    return response
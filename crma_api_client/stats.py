@@ -0,0 +1,61 @@
+"""Contains helpers for collecting latency statistics"""
+
+from collections import deque
+import math
+from typing import Deque, Iterable, Optional
+
+
+def percentile(values: Iterable[float], p: float) -> Optional[float]:
+    """Compute a percentile using the nearest-rank method
+
+    Args:
+        values: Sample values
+        p: Percentile between 0 and 100
+
+    Returns:
+        the percentile value, or None if there are no values
+
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class RollingWindow:
+    """Fixed-size window of the most recent samples"""
+
+    def __init__(self, size: int = 1000) -> None:
+        """Initialize the RollingWindow
+
+        Args:
+            size: Maximum number of samples to keep
+
+        """
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        """Return the number of samples in the window"""
+        return len(self._samples)
+
+    def add(self, value: float) -> None:
+        """Add a sample to the window
+
+        Args:
+            value: Sample value
+
+        """
+        self._samples.append(value)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Compute a percentile over the samples in the window
+
+        Args:
+            p: Percentile between 0 and 100
+
+        Returns:
+            the percentile value, or None if the window is empty
+
+        """
+        return percentile(self._samples, p)
@@ -0,0 +1,393 @@
+"""Contains a synchronous facade for the CRMA API client
+
+All requests run on a single event loop in a background thread that is shared by the
+whole process, so synchronous callers reuse pooled connections instead of creating a
+new event loop, HTTP client and TLS session for every call.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from pydantic import BaseModel
+
+from .client import ConnectionInfo, CRMAAPIClient
+from .resources.dataset import (
+    DatasetVersionResponse,
+    DatasetVersionsResponse,
+    DatasetXmd,
+)
+from .resources.query import QueryLanguage, QueryResponse
+from .scheduler import RequestPriority
+
+T = TypeVar("T")
+
+
+class _LoopThread:
+    """Event loop running forever in a daemon thread"""
+
+    def __init__(self) -> None:
+        """Initialize the _LoopThread and start the thread"""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run, name="crma-api-client-loop", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self) -> None:
+        """Run the event loop"""
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro: Awaitable[T]) -> T:
+        """Run a coroutine on the loop and block until it completes
+
+        Args:
+            coro: Coroutine to run
+
+        Raises:
+            RuntimeError: if called from the loop thread, which would deadlock
+
+        Returns:
+            the result of the coroutine
+
+        """
+        if threading.current_thread() is self.thread:
+            raise RuntimeError(
+                "SyncCRMAAPIClient can't be used from its own event loop thread"
+            )
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+
+_loop_lock = threading.Lock()
+_loop_thread: Optional[_LoopThread] = None
+_loop_pid: Optional[int] = None
+
+
+def _get_loop_thread() -> _LoopThread:
+    """Get the background loop thread for the current process, starting it if needed
+
+    A forked child process (e.g. a Celery prefork worker) doesn't inherit the parent's
+    thread, so a new one is started.
+
+    Returns:
+        the loop thread
+
+    """
+    global _loop_thread, _loop_pid
+    with _loop_lock:
+        if _loop_thread is None or _loop_pid != os.getpid():
+            _loop_thread = _LoopThread()
+            _loop_pid = os.getpid()
+        return _loop_thread
+
+
+#: Key that identifies a shared async client: the instance URL and the client kwargs
+_ClientKey = Tuple[Hashable, ...]
+
+
+class _SharedClient:
+    """Async client shared by facades, with a count of its requests in flight"""
+
+    def __init__(self, conn: ConnectionInfo, kwargs: Dict[str, Any]) -> None:
+        """Initialize the _SharedClient
+
+        Args:
+            conn: Connection info
+            kwargs: Keyword arguments passed to :class:`CRMAAPIClient`
+
+        """
+        self.client = CRMAAPIClient(conn, **kwargs)
+        self.authorization = conn.authorization
+        self.active = 0
+        self.retired = False
+        self.closed = False
+
+    def should_close(self) -> bool:
+        """Return whether the client should be closed now, marking it as closed
+
+        Must be called with the registry lock held.
+        """
+        if self.retired and not self.active and not self.closed:
+            self.closed = True
+            return True
+        return False
+
+
+_clients_lock = threading.Lock()
+_clients: Dict[_ClientKey, _SharedClient] = {}
+_clients_pid: Optional[int] = None
+
+
+def _client_key(conn: ConnectionInfo, kwargs: Dict[str, Any]) -> _ClientKey:
+    """Build the registry key for a connection and client kwargs
+
+    The access token isn't part of the key, so that a refreshed token replaces the
+    client instead of adding another one. Pydantic models such as a HedgePolicy are
+    keyed by value. Other objects, e.g. a CircuitBreaker, are keyed by identity, so
+    facades only share a client if they pass the same instance.
+
+    Args:
+        conn: Connection info
+        kwargs: Keyword arguments passed to :class:`CRMAAPIClient`
+
+    Raises:
+        TypeError: if a kwarg value is unhashable and isn't a pydantic model
+
+    Returns:
+        hashable key
+
+    """
+    items: List[Hashable] = []
+    for name, value in sorted(kwargs.items()):
+        if isinstance(value, BaseModel):
+            value = (type(value), value.json())
+        else:
+            try:
+                hash(value)
+            except TypeError:
+                raise TypeError(
+                    f"SyncCRMAAPIClient option name={name} is unhashable, so the"
+                    " client can't be shared"
+                ) from None
+        items.append((name, value))
+    return (conn.instance_url, *items)
+
+
+def _close_client(shared: _SharedClient) -> None:
+    """Close a retired shared client on the background loop
+
+    Args:
+        shared: Shared client to close
+
+    """
+    _get_loop_thread().run(shared.client.aclose())
+
+
+def _acquire_client(conn: ConnectionInfo, kwargs: Dict[str, Any]) -> _SharedClient:
+    """Get the shared client for a connection and count a request in flight on it
+
+    The registry is reset in a forked child process, since the parent's connections
+    belong to the parent's event loop. If the access token of the connection has
+    changed, the stale client is retired and closed once its requests have
+    completed.
+
+    Args:
+        conn: Connection info
+        kwargs: Keyword arguments passed to :class:`CRMAAPIClient`
+
+    Returns:
+        the shared client, which must be passed to :func:`_release_client`
+
+    """
+    global _clients_pid
+    key = _client_key(conn, kwargs)
+    stale = None
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        shared = _clients.get(key)
+        if shared is not None and shared.authorization != conn.authorization:
+            shared.retired = True
+            if shared.should_close():
+                stale = shared
+            shared = None
+        if shared is None:
+            shared = _clients[key] = _SharedClient(conn, kwargs)
+        shared.active += 1
+    if stale is not None:
+        _close_client(stale)
+    return shared
+
+
+def _release_client(shared: _SharedClient) -> None:
+    """Count a request on a shared client as completed, closing it if it is retired
+
+    Args:
+        shared: Shared client returned by :func:`_acquire_client`
+
+    """
+    with _clients_lock:
+        shared.active -= 1
+        close = shared.should_close()
+    if close:
+        _close_client(shared)
+
+
+@atexit.register
+def close_all() -> None:
+    """Close the shared async clients of the current process
+
+    Clients with requests in flight are closed once those requests have completed.
+    Facades that are used afterwards get new clients. This runs automatically when the
+    process exits.
+    """
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            return
+        retired = list(_clients.values())
+        _clients.clear()
+        closing = []
+        for shared in retired:
+            shared.retired = True
+            if shared.should_close():
+                closing.append(shared)
+    for shared in closing:
+        _close_client(shared)
+
+
+class SyncCRMAAPIClient:
+    """Synchronous CRM Analytics REST API client
+
+    Methods block the calling thread while the request runs on the shared background
+    event loop. Instances created with the same instance URL and options share one
+    pooled async client per process, so creating a facade per call (e.g. in a Celery
+    task) still reuses connections. Instances are thread-safe. Closing a facade
+    doesn't close the shared client, which is closed when the process exits or by
+    :func:`close_all`.
+    """
+
+    def __init__(self, conn: ConnectionInfo, **kwargs: Any) -> None:
+        """Initialize the SyncCRMAAPIClient
+
+        Args:
+            conn: Object containing for making API requests to a Salesforce instance.
+            kwargs: Keyword arguments passed to :class:`CRMAAPIClient`. Pydantic
+                models are compared by value and other objects by identity, so pass
+                the same instances to share a client.
+
+        """
+        _client_key(conn, kwargs)
+        self._conn = conn
+        self._kwargs = kwargs
+
+    @property
+    def client(self) -> CRMAAPIClient:
+        """Async client used to send requests, shared by the process"""
+        shared = _acquire_client(self._conn, self._kwargs)
+        _release_client(shared)
+        return shared.client
+
+    def __enter__(self) -> "SyncCRMAAPIClient":
+        """Enter the client context"""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Exit the client context"""
+        self.close()
+
+    def close(self) -> None:
+        """Release the facade
+
+        This is a no-op, since the pooled async client is shared with other facades
+        that may have requests in flight. Use :func:`close_all` to close the pooled
+        clients before the process exits.
+        """
+
+    def _run(self, call: Callable[[CRMAAPIClient], Awaitable[T]]) -> T:
+        """Run a request with the shared client and block until it completes
+
+        Args:
+            call: Function that starts the request with the async client
+
+        Returns:
+            the result of the request
+
+        """
+        shared = _acquire_client(self._conn, self._kwargs)
+        try:
+            return _get_loop_thread().run(call(shared.client))
+        finally:
+            _release_client(shared)
+
+    def list_dataset_versions(
+        self,
+        identifier: str,
+        priority: RequestPriority = RequestPriority.default,
+    ) -> DatasetVersionsResponse:
+        """List the versions for a dataset
+
+        Args:
+            identifier: Dataset name or ID
+            priority: Priority class of the request
+
+        Returns:
+            list of all versions for the dataset
+
+        """
+        return self._run(
+            lambda client: client.list_dataset_versions(identifier, priority=priority)
+        )
+
+    def get_dataset_version(
+        self,
+        dataset_id: str,
+        version_id: str,
+        priority: RequestPriority = RequestPriority.default,
+    ) -> DatasetVersionResponse:
+        """Get a single version for a dataset
+
+        Args:
+            dataset_id: Dataset name or ID
+            version_id: Version ID
+            priority: Priority class of the request
+
+        Returns:
+            the version of the dataset
+
+        """
+        return self._run(
+            lambda client: client.get_dataset_version(
+                dataset_id, version_id, priority=priority
+            )
+        )
+
+    def query(
+        self,
+        query: str,
+        query_language: QueryLanguage = QueryLanguage.saql,
+        name: Optional[str] = None,
+        timezone: Optional[str] = None,
+        priority: RequestPriority = RequestPriority.default,
+        xmd: Optional[DatasetXmd] = None,
+    ) -> QueryResponse:
+        """Execute a query
+
+        Args:
+            query: Query string
+            query_language: Query language. One of: SAQL (default), SQL
+            name: Query name. Defaults to a UUID
+            timezone: Timezone for the query
+            priority: Priority class of the request
+            xmd: Extended metadata of the dataset the query loads, used to validate
+                the query before it is sent
+
+        Returns:
+            query results containing records and metadata. If the payload is larger
+            than the spill threshold, the results are backed by a file on disk, which
+            is deleted when the response is closed.
+
+        """
+        return self._run(
+            lambda client: client.query(
+                query,
+                query_language=query_language,
+                name=name,
+                timezone=timezone,
+                priority=priority,
+                xmd=xmd,
+            )
+        )
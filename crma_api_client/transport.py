@@ -0,0 +1,259 @@
+"""Contains HTTP transports for recording and replaying API traffic
+
+Recorded exchanges are stored in a gzip-compressed JSON lines archive. The archive
+can be replayed without network access, e.g. to profile parsing, caching and
+concurrency changes against realistic payloads.
+"""
+
+import asyncio
+import base64
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+import gzip
+import json
+import os
+import time
+from typing import Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+from pydantic import BaseModel
+
+#: Headers that are never written to an archive
+SENSITIVE_HEADERS = {"authorization", "cookie", "set-cookie"}
+
+#: Response headers that no longer apply once the body has been decoded
+ENCODING_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+#: Keys ignored when matching JSON request bodies. Query names default to a random
+#: UUID, so they would otherwise never match.
+DEFAULT_IGNORE_BODY_KEYS = ("name",)
+
+PathType = Union[str, "os.PathLike[str]"]
+
+
+class ReplayMissError(LookupError):
+    """Raised when a request has no recorded exchange in the archive"""
+
+
+class RecordedExchange(BaseModel):
+    """Request/response pair stored in an archive
+
+    Bodies are base64-encoded since they may contain arbitrary bytes.
+    """
+
+    recorded_at: datetime
+    method: str
+    url: str
+    request_headers: Dict[str, str]
+    request_body: str
+    status_code: int
+    response_headers: List[Tuple[str, str]]
+    response_body: str
+    #: Time between sending the request and reading the full response, in seconds
+    elapsed: float
+
+    def match_key(self, ignore_body_keys: Sequence[str]) -> Tuple[str, str, str]:
+        """Return the key used to match a request against this exchange
+
+        Args:
+            ignore_body_keys: Keys to drop from JSON request bodies
+
+        Returns:
+            tuple of (method, path with query string, normalized body)
+
+        """
+        return _match_key(
+            self.method,
+            httpx.URL(self.url),
+            base64.b64decode(self.request_body),
+            ignore_body_keys,
+        )
+
+
+def _match_key(
+    method: str, url: httpx.URL, body: bytes, ignore_body_keys: Sequence[str]
+) -> Tuple[str, str, str]:
+    """Build the key used to match a request with a recorded exchange
+
+    The host is ignored so an archive recorded against one instance can be replayed
+    against another.
+
+    Args:
+        method: HTTP method
+        url: Request URL
+        body: Raw request body
+        ignore_body_keys: Keys to drop from JSON request bodies
+
+    Returns:
+        tuple of (method, path with query string, normalized body)
+
+    """
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        normalized = base64.b64encode(body).decode()
+    else:
+        if isinstance(data, dict):
+            data = {k: v for k, v in data.items() if k not in ignore_body_keys}
+        normalized = json.dumps(data, sort_keys=True)
+    return method.upper(), url.raw_path.decode("ascii"), normalized
+
+
+def read_archive(path: PathType) -> List[RecordedExchange]:
+    """Read all exchanges from an archive
+
+    Args:
+        path: Path to the archive
+
+    Returns:
+        list of exchanges in the order they were recorded
+
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [RecordedExchange.parse_raw(line) for line in f if line.strip()]
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Transport that records every request/response pair to an archive
+
+    Sensitive headers such as ``Authorization`` are not recorded.
+    """
+
+    def __init__(
+        self, path: PathType, transport: Optional[httpx.AsyncBaseTransport] = None
+    ) -> None:
+        """Initialize the RecordingTransport
+
+        Args:
+            path: Path to the archive. Exchanges are appended if it already exists.
+            transport: Transport that sends the requests. Defaults to a new
+                httpx.AsyncHTTPTransport.
+
+        """
+        self.path = path
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send the request with the wrapped transport and record the exchange
+
+        Args:
+            request: Request to send
+
+        Returns:
+            response with a fully-read body
+
+        """
+        request_body = await request.aread()
+        start = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        elapsed = time.perf_counter() - start
+
+        excluded_headers = SENSITIVE_HEADERS | ENCODING_HEADERS
+        headers = [
+            (key, value)
+            for key, value in response.headers.multi_items()
+            if key.lower() not in excluded_headers
+        ]
+        exchange = RecordedExchange(
+            recorded_at=datetime.now(timezone.utc),
+            method=request.method,
+            url=str(request.url),
+            request_headers={
+                key: value
+                for key, value in request.headers.items()
+                if key.lower() not in SENSITIVE_HEADERS
+            },
+            request_body=base64.b64encode(request_body).decode(),
+            status_code=response.status_code,
+            response_headers=headers,
+            response_body=base64.b64encode(content).decode(),
+            elapsed=elapsed,
+        )
+        # Each write adds a separate gzip member, which readers concatenate
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(exchange.json() + "\n")
+
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            content=content,
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        """Close the wrapped transport"""
+        await self._transport.aclose()
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Transport that serves responses from an archive without network access
+
+    Requests are matched on method, path, query string and body. When a request
+    matches several exchanges they are served in recorded order, cycling back to the
+    first one once all of them have been served.
+    """
+
+    def __init__(
+        self,
+        path: PathType,
+        reproduce_latency: bool = False,
+        speed: float = 1.0,
+        ignore_body_keys: Sequence[str] = DEFAULT_IGNORE_BODY_KEYS,
+    ) -> None:
+        """Initialize the ReplayTransport
+
+        Args:
+            path: Path to the archive
+            reproduce_latency: Whether to wait for the recorded elapsed time before
+                returning each response
+            speed: Factor by which reproduced latencies are sped up
+            ignore_body_keys: Keys to drop from JSON request bodies when matching
+
+        """
+        self.reproduce_latency = reproduce_latency
+        self.speed = speed
+        self.ignore_body_keys = ignore_body_keys
+        self._exchanges: Dict[
+            Tuple[str, str, str], Deque[RecordedExchange]
+        ] = defaultdict(deque)
+        for exchange in read_archive(path):
+            self._exchanges[exchange.match_key(ignore_body_keys)].append(exchange)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Serve the recorded response for a request
+
+        Args:
+            request: Request to replay
+
+        Raises:
+            ReplayMissError: if the archive has no matching exchange
+
+        Returns:
+            recorded response
+
+        """
+        key = _match_key(
+            request.method, request.url, await request.aread(), self.ignore_body_keys
+        )
+        exchanges = self._exchanges.get(key)
+        if not exchanges:
+            raise ReplayMissError(
+                f"No recorded exchange for method={request.method} url={request.url}"
+            )
+        exchange = exchanges[0]
+        exchanges.rotate(-1)
+
+        if self.reproduce_latency:
+            await asyncio.sleep(exchange.elapsed / self.speed)
+
+        return httpx.Response(
+            exchange.status_code,
+            headers=exchange.response_headers,
+            content=base64.b64decode(exchange.response_body),
+            request=request,
+        )
@@ -0,0 +1,45 @@
+"""Contains shared unit test fixtures"""
+
+from typing import Any, Dict
+
+import pytest
+
+from crma_api_client.client import ConnectionInfo
+
+
+@pytest.fixture
+def conn() -> ConnectionInfo:
+    """Returns connection info for a fake Salesforce instance"""
+    return ConnectionInfo(
+        instance_url="https://example.my.salesforce.com", access_token="token"
+    )
+
+
+@pytest.fixture
+def query_payload() -> Dict[str, Any]:
+    """Returns a query response payload"""
+    return {
+        "action": "query",
+        "responseId": "response-id",
+        "query": "query-string",
+        "responseTime": 10,
+        "results": {
+            "records": [
+                {"Category": "Furniture", "Sales": 741999.7953},
+                {"Category": "Office Supplies", "Sales": 719047.032},
+                {"Category": "Technology", "Sales": 836154.033},
+            ],
+            "metadata": [
+                {
+                    "queryLanguage": "SAQL",
+                    "lineage": {
+                        "type": "foreach",
+                        "projections": [
+                            {"field": {"id": "q.Category", "type": "string"}},
+                            {"field": {"id": "q.Sales", "type": "numeric"}},
+                        ],
+                    },
+                }
+            ],
+        },
+    }
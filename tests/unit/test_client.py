@@ -0,0 +1,86 @@
+"""Contains unit tests for the client module"""
+
+import asyncio
+import gc
+from unittest.mock import AsyncMock
+
+import httpx
+
+from crma_api_client.client import ConnectionInfo, CRMAAPIClient
+
+CONN = ConnectionInfo(
+    instance_url="https://example.my.salesforce.com", access_token="token"
+)
+
+PAGES = {
+    "/wave/datasets": {
+        "datasets": [{"id": "0Fb1", "name": "Orders"}, {"id": "0Fb2", "name": "Items"}],
+        "nextPageUrl": "/services/data/v54.0/wave/datasets?page=abc",
+        "url": "/services/data/v54.0/wave/datasets",
+    },
+    "/wave/datasets?page=abc": {
+        "datasets": [{"id": "0Fb3", "name": "Accounts"}],
+        "nextPageUrl": None,
+        "url": "/services/data/v54.0/wave/datasets?page=abc",
+    },
+}
+
+
+async def test_list_datasets():
+    """Should follow the next page URL and yield datasets from every page"""
+
+    async def request(path, method, **kwargs):
+        return httpx.Response(200, json=PAGES[path])
+
+    client = CRMAAPIClient(CONN)
+    client.request = AsyncMock(side_effect=request)
+
+    datasets = [dataset async for dataset in client.list_datasets(q="o", page_size=2)]
+
+    assert [d.name for d in datasets] == ["Orders", "Items", "Accounts"]
+    first_call, second_call = client.request.call_args_list
+    assert first_call.kwargs["params"] == {"q": "o", "pageSize": 2}
+    assert second_call.args[0] == "/wave/datasets?page=abc"
+    assert second_call.kwargs["params"] is None
+
+
+async def test_list_datasets__prefetch():
+    """Should request the next page while the current page is being consumed"""
+    events = []
+
+    def handler(request):
+        path = request.url.raw_path.decode().split("/v54.0", 1)[1]
+        events.append(f"request {path}")
+        return httpx.Response(200, json=PAGES[path])
+
+    client = CRMAAPIClient(CONN, transport=httpx.MockTransport(handler))
+    async for dataset in client.list_datasets():
+        events.append(f"consume {dataset.name}")
+        await asyncio.sleep(0)
+
+    assert events == [
+        "request /wave/datasets",
+        "consume Orders",
+        "request /wave/datasets?page=abc",
+        "consume Items",
+        "consume Accounts",
+    ]
+
+
+async def test_list_datasets__early_exit(caplog):
+    """Should retrieve the result of a failed prefetch when iteration stops early"""
+
+    def handler(request):
+        if request.url.params.get("page"):
+            return httpx.Response(500)
+        return httpx.Response(200, json=PAGES["/wave/datasets"])
+
+    client = CRMAAPIClient(CONN, transport=httpx.MockTransport(handler))
+    datasets = client.list_datasets()
+    async for _ in datasets:
+        await asyncio.sleep(0.01)
+        break
+    await datasets.aclose()
+    gc.collect()
+
+    assert not [r for r in caplog.records if r.name == "asyncio"]
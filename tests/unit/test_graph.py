@@ -0,0 +1,111 @@
+"""Contains unit tests for the graph module"""
+
+import asyncio
+
+import pytest
+
+from crma_api_client.graph import Binding, QueryGraph, QueryGraphError, QueryNode
+from crma_api_client.resources.query import QueryResponse
+
+
+class FakeClient:
+    """Client that returns canned records for each query string"""
+
+    def __init__(self, query_payload, records):
+        self.query_payload = query_payload
+        self.records = records
+        self.queries = []
+
+    async def query(self, query, **kwargs):
+        self.queries.append(query)
+        await asyncio.sleep(0)
+        payload = {**self.query_payload, "query": query}
+        payload["results"] = {**payload["results"], "records": self.records[query]}
+        return QueryResponse.parse_obj(payload)
+
+
+async def test_query_graph_execute(query_payload):
+    """Should fill downstream templates from upstream results and share sub-results"""
+    client = FakeClient(
+        query_payload,
+        {
+            "top": [{"Region": "West"}, {"Region": "East"}],
+            'by_region "West"': [{"Sales": 1}],
+            'all_regions ["West", "East"]': [{"Sales": 2}],
+        },
+    )
+    graph = QueryGraph(
+        [
+            QueryNode(name="top", template="top"),
+            QueryNode(
+                name="west",
+                template="by_region {{region}}",
+                bindings={"region": Binding(source="top", column="Region")},
+            ),
+            QueryNode(
+                name="west_again",
+                template="by_region {{ region }}",
+                bindings={"region": Binding(source="top", column="Region")},
+            ),
+            QueryNode(
+                name="all",
+                template="all_regions {{regions}}",
+                bindings={"regions": Binding(source="top", column="Region", row=None)},
+            ),
+        ]
+    )
+
+    results = await graph.execute(client)
+
+    assert results["west"].results.records == [{"Sales": 1}]
+    assert results["west_again"] is results["west"]
+    assert results["all"].results.records == [{"Sales": 2}]
+    assert sorted(client.queries) == sorted(
+        ["top", 'by_region "West"', 'all_regions ["West", "East"]']
+    )
+
+
+def test_query_graph_validate__cycle():
+    """Should reject graphs with cycles"""
+    graph = QueryGraph(
+        [
+            QueryNode(
+                name="a",
+                template="{{x}}",
+                bindings={"x": Binding(source="b", column="c")},
+            ),
+            QueryNode(
+                name="b",
+                template="{{x}}",
+                bindings={"x": Binding(source="a", column="c")},
+            ),
+        ]
+    )
+    with pytest.raises(QueryGraphError, match="Cycle"):
+        graph.validate()
+
+
+def test_query_graph_validate__missing_binding():
+    """Should reject templates with placeholders that have no binding"""
+    graph = QueryGraph([QueryNode(name="a", template="{{x}}")])
+    with pytest.raises(QueryGraphError, match="no bindings"):
+        graph.validate()
+
+
+def test_binding_resolve__missing_column(query_payload):
+    """Should reject bindings to a column that the source records don't have"""
+    response = QueryResponse.parse_obj(query_payload)
+    assert Binding(source="a", column="Category").resolve(response) == "Furniture"
+    with pytest.raises(QueryGraphError, match="no column=Region"):
+        Binding(source="a", column="Region").resolve(response)
+    with pytest.raises(QueryGraphError, match="no column=Region"):
+        Binding(source="a", column="Region", row=None).resolve(response)
+
+
+def test_query_node_render__null():
+    """Should format null values as SAQL nulls instead of strings"""
+    node = QueryNode(name="a", template="'Region' == {{r}} && 'State' in {{s}}")
+    assert (
+        node.render({"r": None, "s": ["CA", None, 1.5]})
+        == "'Region' == null && 'State' in [\"CA\", null, 1.5]"
+    )
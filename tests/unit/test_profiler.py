@@ -0,0 +1,55 @@
+"""Contains unit tests for the profiler module"""
+
+from datetime import datetime, timezone
+import logging
+
+from crma_api_client.profiler import QueryProfile, QueryProfiler
+
+
+def make_profile(name, wall_time, server_time):
+    """Create a profile for a query execution"""
+    return QueryProfile(
+        name=name,
+        query="q = load ...;",
+        started_at=datetime.now(timezone.utc),
+        wall_time=wall_time,
+        server_time=server_time,
+        network_time=0.01,
+        queue_time=0.0,
+        decode_time=0.02,
+        parse_time=0.03,
+        row_count=10,
+        payload_size=1000,
+    )
+
+
+def test_query_profiler_summary():
+    """Should summarize executions by query name"""
+    profiler = QueryProfiler()
+    profiler.record(make_profile("server-bound", 2.0, 1.9))
+    profiler.record(make_profile("server-bound", 1.0, 0.9))
+    profiler.record(make_profile("client-bound", 0.2, 0.01))
+
+    server_bound, client_bound = profiler.summary()
+    assert server_bound.name == "server-bound"
+    assert server_bound.count == 2
+    assert server_bound.p50["server_time"] == 0.9
+    assert server_bound.p95["wall_time"] == 2.0
+    assert server_bound.bound == "server"
+    assert client_bound.bound == "client"
+    assert client_bound.p50["client_time"] == 0.05
+
+    report = profiler.report().splitlines()
+    assert len(report) == 3
+    assert report[1].startswith("server-bound")
+
+
+def test_query_profiler_slow_query_log(caplog):
+    """Should log queries above the slow-query threshold"""
+    profiler = QueryProfiler(slow_query_threshold=1.0)
+    with caplog.at_level(logging.WARNING):
+        profiler.record(make_profile("fast", 0.5, 0.4))
+        profiler.record(make_profile("slow", 1.5, 1.4))
+
+    assert len(caplog.records) == 1
+    assert "name=slow" in caplog.records[0].getMessage()
@@ -0,0 +1,127 @@
+"""Contains unit tests for the resilience module"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from crma_api_client.client import ConnectionInfo, CRMAAPIClient
+from crma_api_client.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+    hedge,
+    HedgePolicy,
+)
+from crma_api_client.stats import RollingWindow
+
+
+async def test_hedge__fast_primary():
+    """Should not send a hedge when the first attempt finishes within the delay"""
+    calls = []
+
+    async def send():
+        calls.append(1)
+        return "ok"
+
+    assert await hedge(send, 0.5) == ("ok", False, False)
+    assert len(calls) == 1
+
+
+async def test_hedge__slow_primary():
+    """Should send a hedge after the delay and return whichever finishes first"""
+    delays = [1.0, 0.0]
+
+    async def send():
+        delay = delays.pop(0)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert await hedge(send, 0.01) == (0.0, True, True)
+
+
+def test_hedge_policy_delay():
+    """Should use the latency percentile clamped to the configured bounds"""
+    policy = HedgePolicy(min_samples=3, initial_delay=2.0, max_delay=0.5)
+    latencies = RollingWindow()
+    assert policy.delay(latencies) == 2.0
+    for value in (0.1, 0.2, 0.3):
+        latencies.add(value)
+    assert policy.delay(latencies) == 0.3
+    latencies.add(5.0)
+    assert policy.delay(latencies) == 0.5
+
+
+def test_circuit_breaker():
+    """Should open after consecutive failures and close after a successful probe"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            with breaker.guard():
+                raise httpx.ConnectError("boom")
+
+    assert breaker.state == CircuitState.open
+    assert breaker.trip_count == 1
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pass
+    assert breaker.rejection_count == 1
+
+    breaker.reset_timeout = 0.0
+    assert breaker.state == CircuitState.half_open
+    with breaker.guard():
+        pass
+    assert breaker.state == CircuitState.closed
+
+
+def test_circuit_breaker__cancelled_request():
+    """Should only admit another probe if the cancelled request was the probe"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    in_flight = breaker.guard()
+    in_flight.__enter__()
+    with pytest.raises(httpx.ConnectError):
+        with breaker.guard():
+            raise httpx.ConnectError("boom")
+
+    probe = breaker.guard()
+    probe.__enter__()
+    cancelled = asyncio.CancelledError()
+    in_flight.__exit__(asyncio.CancelledError, cancelled, None)
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pass
+
+    probe.__exit__(asyncio.CancelledError, cancelled, None)
+    with breaker.guard():
+        pass
+    assert breaker.state == CircuitState.closed
+
+
+async def test_client_resilience_stats():
+    """Should count hedges, trips and rejections of requests sent by the client"""
+    delays = [0.5, 0.0]
+
+    async def handler(request):
+        if not request.url.path.endswith("/versions"):
+            return httpx.Response(500)
+        await asyncio.sleep(delays.pop(0))
+        return httpx.Response(200, json={"versions": [], "url": "/versions"})
+
+    client = CRMAAPIClient(
+        ConnectionInfo(
+            instance_url="https://example.my.salesforce.com", access_token="token"
+        ),
+        hedge_policy=HedgePolicy(initial_delay=0.01),
+        circuit_breaker=CircuitBreaker(failure_threshold=1),
+        transport=httpx.MockTransport(handler),
+    )
+    await client.list_dataset_versions("dataset")
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.get_dataset_version("dataset", "version")
+    with pytest.raises(CircuitOpenError):
+        await client.list_dataset_versions("dataset")
+
+    stats = client.resilience_stats
+    assert (stats.hedges_sent, stats.hedges_won) == (1, 1)
+    assert (stats.circuit_trips, stats.circuit_rejections) == (1, 1)
+    assert stats.circuit_state == CircuitState.open
@@ -1,6 +1,6 @@
 """Contains unit tests for the resources/query module"""
 
-from crma_api_client.resources.query import ProjectionField, QueryResponse
+from crma_api_client.resources.query import ProjectionField, QueryResponse, ResultSchema
 
 
 def test_query_response_fields__foreach():
@@ -146,3 +146,72 @@ def test_query_response_fields__union():
         ProjectionField(id="q2.entity", type="string"),
         ProjectionField(id="q2.dimension", type="string"),
     ]
+
+
+def test_result_schema():
+    """Should precompute names, indexes and converters of the projected fields"""
+    schema = ResultSchema(
+        [
+            ProjectionField(id="q.Category", type="string"),
+            ProjectionField(id="q.Sales", type="numeric"),
+            ProjectionField(id="q.Tags", type="multivalue"),
+        ]
+    )
+    records = [
+        {"Category": "Furniture", "Sales": "1.5", "Tags": ["a"]},
+        {"Category": 1, "Sales": None, "Tags": None},
+    ]
+
+    assert schema.names == ["Category", "Sales", "Tags"]
+    assert schema.names_by_id["q.Sales"] == "Sales"
+    assert schema.indexes == {"Category": 0, "Sales": 1, "Tags": 2}
+    assert schema.matches(records[0])
+    assert not schema.matches({"Category": "Furniture", "Sales": 1.5})
+    assert not schema.matches({"Category": "Furniture", "Sales": 1.5, "Other": 1})
+    assert schema.convert(records[0]) == {
+        "Category": "Furniture",
+        "Sales": 1.5,
+        "Tags": ["a"],
+    }
+    assert schema.columns(records) == {
+        "Category": ["Furniture", "1"],
+        "Sales": [1.5, None],
+        "Tags": [["a"], None],
+    }
+
+
+def test_query_response_attach_schema(query_payload):
+    """Should use an attached schema instead of walking the lineage"""
+    schema = ResultSchema([ProjectionField(id="q.Other", type="string")])
+    query_response = QueryResponse.parse_obj(query_payload)
+    query_response.attach_schema(schema)
+
+    assert query_response.result_schema is schema
+    assert query_response.fields is schema.fields
+    assert [f.name for f in QueryResponse.parse_obj(query_payload).fields] == [
+        "Category",
+        "Sales",
+    ]
+
+
+def test_query_results_column(query_payload):
+    """Should return column values, with None for records without the field"""
+    query_payload["results"]["records"].append({"Category": "Other"})
+    results = QueryResponse.parse_obj(query_payload).results
+
+    assert results.column("Category") == [
+        "Furniture",
+        "Office Supplies",
+        "Technology",
+        "Other",
+    ]
+    assert results.column("Sales")[-1] is None
+
+
+def test_query_response_context_manager(query_payload):
+    """Should support the context manager protocol for in-memory results"""
+    with QueryResponse.parse_obj(query_payload) as query_response:
+        records = query_response.results.records
+    query_response.close()
+
+    assert query_response.results.records == records
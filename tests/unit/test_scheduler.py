@@ -0,0 +1,61 @@
+"""Contains unit tests for the scheduler module"""
+
+import asyncio
+
+from crma_api_client.scheduler import PriorityScheduler, RequestPriority
+
+
+async def test_priority_scheduler__admits_by_priority():
+    """Should admit queued requests in priority order once a slot frees up"""
+    scheduler = PriorityScheduler(max_concurrency=1)
+    order = []
+
+    async def run(label, priority):
+        async with scheduler.slot(priority):
+            order.append(label)
+            await asyncio.sleep(0)
+
+    await scheduler.acquire()
+    tasks = [
+        asyncio.create_task(run("batch", RequestPriority.batch)),
+        asyncio.create_task(run("default", RequestPriority.default)),
+        asyncio.create_task(run("interactive", RequestPriority.interactive)),
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.pending == 3
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    assert order == ["interactive", "default", "batch"]
+    assert scheduler.active == 0
+
+
+async def test_priority_scheduler__ages_waiting_requests():
+    """Should admit a long-waiting low-priority request ahead of newer ones"""
+    scheduler = PriorityScheduler(max_concurrency=1, aging_interval=0.01)
+    order = []
+
+    async def run(label, priority):
+        async with scheduler.slot(priority):
+            order.append(label)
+
+    await scheduler.acquire()
+    batch = asyncio.create_task(run("batch", RequestPriority.batch))
+    await asyncio.sleep(0.05)
+    interactive = asyncio.create_task(run("interactive", RequestPriority.interactive))
+    await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(batch, interactive)
+    assert order == ["batch", "interactive"]
+
+
+async def test_priority_scheduler__cancelled_waiter():
+    """Should drop a cancelled waiter from the queue"""
+    scheduler = PriorityScheduler(max_concurrency=1)
+    await scheduler.acquire()
+    task = asyncio.create_task(scheduler.acquire(RequestPriority.batch))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert scheduler.pending == 0
+    scheduler.release()
+    assert scheduler.active == 0
@@ -0,0 +1,82 @@
+"""Contains unit tests for the schema module"""
+
+import pytest
+
+from crma_api_client.resources.dataset import DatasetXmd
+from crma_api_client.resources.query import QueryResponse
+from crma_api_client.schema import (
+    query_fingerprint,
+    SchemaCache,
+    SchemaValidationError,
+    validate_query,
+)
+
+USER = {"id": "005", "name": "Jon", "profilePhotoUrl": "https://example.com/photo"}
+
+XMD = DatasetXmd.parse_obj(
+    {
+        "createdBy": USER,
+        "createdDate": "2022-04-01T00:00:00.000Z",
+        "dates": [],
+        "derivedDimensions": [],
+        "derivedMeasures": [],
+        "dimensions": [
+            {"field": "Category", "label": "Category"},
+            {"field": "Account.Name", "label": "Account Name"},
+        ],
+        "lastModifiedBy": USER,
+        "lastModifiedDate": "2022-04-01T00:00:00.000Z",
+        "measures": [{"field": "Sales", "label": "Sales"}],
+        "type": "main",
+        "url": "/services/data/v54.0/wave/datasets/0Fb/versions/0Fc/xmds/main",
+    }
+)
+
+
+def test_schema_cache_apply(query_payload):
+    """Should reuse the cached schema for a repeated query"""
+    cache = SchemaCache()
+    fingerprint = query_fingerprint("q = load ...;")
+    first = QueryResponse.parse_obj(query_payload)
+    second = QueryResponse.parse_obj(query_payload)
+
+    schema = cache.apply(fingerprint, first)
+    assert cache.apply(fingerprint, second) is schema
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert second.fields is first.fields
+
+
+def test_schema_cache_apply__changed_shape(query_payload):
+    """Should rebuild the schema when the records no longer match it"""
+    cache = SchemaCache()
+    fingerprint = query_fingerprint("q = load ...;")
+    cache.apply(fingerprint, QueryResponse.parse_obj(query_payload))
+    query_payload["results"]["records"] = [{"Other": 1}]
+    cache.apply(fingerprint, QueryResponse.parse_obj(query_payload))
+    assert cache.misses == 2
+
+
+def test_query_fingerprint():
+    """Should ignore differences in whitespace"""
+    assert query_fingerprint("q = load  x;\n") == query_fingerprint("q = load x;")
+
+
+def test_validate_query():
+    """Should accept known fields and aliases and reject unknown fields"""
+    validate_query(
+        "\n".join(
+            [
+                'q = load "0Fb/0Fc";',
+                "q = group q by ('Category', 'Account.Name');",
+                "q = foreach q generate q.'Category' as 'Jon\\'s Category',"
+                " sum(q.Sales) as 'Sales';",
+                "q = order q by 'Jon\\'s Category' asc;",
+            ]
+        ),
+        XMD,
+    )
+    with pytest.raises(SchemaValidationError, match="Profit"):
+        validate_query(
+            "q = load \"0Fb/0Fc\";\nq = foreach q generate sum(q.'Profit') as 'P';",
+            XMD,
+        )
@@ -0,0 +1,126 @@
+"""Contains unit tests for the spill module"""
+
+import io
+import json
+import os
+
+import httpx
+import pytest
+
+from crma_api_client import spill
+from crma_api_client.client import CRMAAPIClient
+from crma_api_client.resources.query import QueryResponse
+from crma_api_client.schema import SchemaCache
+from crma_api_client.spill import (
+    parse_spilled_query_response,
+    spill_records,
+    SpilledQueryResults,
+)
+
+
+def test_spill_records(tmp_path, query_payload):
+    """Should serve records, slices and columns from the spill file"""
+    records = [
+        {"Category": "Furniture", "Sales": 1.5, "Count": 1, "Tags": ["a"]},
+        {"Category": None, "Sales": None, "Count": 2, "Tags": None},
+        {"Category": "Technology", "Sales": 3.0, "Count": None, "Tags": []},
+    ]
+    metadata = QueryResponse.parse_obj(query_payload).results.metadata
+    results = spill_records(metadata, records, str(tmp_path))
+    (path,) = tmp_path.iterdir()
+
+    assert results.records == records
+    assert len(results.records) == 3
+    assert results.records[-1] == records[-1]
+    assert results.records[1:] == records[1:]
+    assert list(results.records) == records
+    assert results.column("Sales")[:] == [1.5, None, 3.0]
+    assert list(results.column("Count")) == [1, 2, None]
+    assert results.metadata == metadata
+
+    results.close()
+    assert not os.path.exists(path)
+
+
+def test_spill_records__sparse_and_mixed(tmp_path, monkeypatch, query_payload):
+    """Should read back sparse records and mixed numeric columns exactly"""
+    monkeypatch.setattr(spill, "ROW_GROUP_SIZE", 2)
+    records = [{"A": 1}, {"A": 1.5, "B": "x"}, {"B": None}, {"A": 2**70, "C": True}]
+    metadata = QueryResponse.parse_obj(query_payload).results.metadata
+    results = spill_records(metadata, records, str(tmp_path))
+
+    assert list(results.records) == records
+    assert [results.records[i] for i in range(4)] == records
+    assert [type(record.get("A")) for record in results.records] == [
+        int,
+        float,
+        type(None),
+        int,
+    ]
+    assert results.column("B")[:] == [None, "x", None, None]
+    assert results.column("C")[:] == [None, None, None, True]
+    assert results.column("D")[:] == [None] * 4
+    results.close()
+
+
+def test_parse_spilled_query_response(tmp_path, monkeypatch, query_payload):
+    """Should decode records across chunk boundaries and parse the rest"""
+    monkeypatch.setattr(spill, "READ_CHUNK_SIZE", 7)
+    records = [
+        {"Category": 'Fur"ni\\ture', "Sales": 1},
+        {"Category": "Café ☕", "Sales": 2.5},
+    ]
+    payload = {
+        "results": {
+            "records": records,
+            "metadata": query_payload["results"]["metadata"],
+        },
+        **{k: v for k, v in query_payload.items() if k != "results"},
+    }
+    f = io.BytesIO(json.dumps(payload, ensure_ascii=False, indent=1).encode())
+
+    with parse_spilled_query_response(f, str(tmp_path)) as response:
+        assert isinstance(response.results, SpilledQueryResults)
+        assert response.results.records == records
+        assert response.response_id == query_payload["responseId"]
+        assert [field.name for field in response.fields] == ["Category", "Sales"]
+        path = response.results.path
+
+    assert not os.path.exists(path)
+
+
+async def test_client_query__spill(conn, tmp_path, query_payload):
+    """Should stream payloads above the threshold to disk and spill their records"""
+    mock = httpx.MockTransport(lambda request: httpx.Response(200, json=query_payload))
+    schema_cache = SchemaCache()
+    async with CRMAAPIClient(
+        conn,
+        transport=mock,
+        spill_threshold=10,
+        spill_dir=str(tmp_path),
+        schema_cache=schema_cache,
+    ) as client:
+        with await client.query("q = load ...;") as response:
+            assert isinstance(response.results, SpilledQueryResults)
+            assert response.results.records == query_payload["results"]["records"]
+            path = response.results.path
+        assert not os.path.exists(path)
+
+        with await client.query("q = load ...;") as response:
+            assert response.results.column("Sales")[:] == [
+                record["Sales"] for record in query_payload["results"]["records"]
+            ]
+        assert (schema_cache.hits, schema_cache.misses) == (1, 1)
+
+        client.spill_threshold = 1 << 20
+        with await client.query("q = load ...;") as response:
+            assert not isinstance(response.results, SpilledQueryResults)
+            assert response.results.column("Category")[0] == "Furniture"
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_client__spill_threshold(conn):
+    """Should reject spill thresholds that would never roll over to disk"""
+    with pytest.raises(ValueError, match="spill_threshold"):
+        CRMAAPIClient(conn, spill_threshold=0)
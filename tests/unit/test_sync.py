@@ -0,0 +1,98 @@
+"""Contains unit tests for the sync module"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import httpx
+import pytest
+
+from crma_api_client.resilience import HedgePolicy
+from crma_api_client.sync import close_all, SyncCRMAAPIClient
+
+
+def test_sync_client_query(conn, query_payload):
+    """Should run queries from several threads on one shared loop and client"""
+    loop_threads = set()
+
+    def handler(request):
+        loop_threads.add(threading.current_thread().name)
+        return httpx.Response(200, json=query_payload)
+
+    with SyncCRMAAPIClient(conn, transport=httpx.MockTransport(handler)) as client:
+        with ThreadPoolExecutor(4) as executor:
+            responses = list(executor.map(client.query, ["q = load ...;"] * 8))
+        async_client = client.client
+
+        assert client.client is async_client
+        assert all(r.results.records == responses[0].results.records for r in responses)
+        assert loop_threads == {"crma-api-client-loop"}
+
+
+def test_sync_client__shared_per_process(conn):
+    """Should share one async client between facades with the same options"""
+    transport = httpx.MockTransport(lambda request: httpx.Response(200))
+    first = SyncCRMAAPIClient(conn, transport=transport, hedge_policy=HedgePolicy())
+    second = SyncCRMAAPIClient(conn, transport=transport, hedge_policy=HedgePolicy())
+    other = SyncCRMAAPIClient(conn, transport=transport, timeout=5.0)
+
+    assert first.client is second.client
+    assert other.client is not first.client
+
+    async_client = first.client
+    first.close()
+    assert second.client is async_client
+    with pytest.raises(TypeError, match="unhashable"):
+        SyncCRMAAPIClient(conn, transport=transport, version=["v54.0"])
+
+
+def test_sync_client__close_with_request_in_flight(conn, query_payload):
+    """Should keep serving requests in flight when another facade is closed"""
+    started = threading.Event()
+
+    async def handler(request):
+        started.set()
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json=query_payload)
+
+    transport = httpx.MockTransport(handler)
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(
+            SyncCRMAAPIClient(conn, transport=transport).query, "q = load ...;"
+        )
+        assert started.wait(5)
+        with SyncCRMAAPIClient(conn, transport=transport):
+            pass
+        close_all()
+        response = future.result()
+
+    assert response.results.records == query_payload["results"]["records"]
+
+
+def test_sync_client__refreshed_token(conn, query_payload):
+    """Should replace the client of a stale token once its requests have completed"""
+    started = threading.Event()
+    authorizations = []
+
+    async def handler(request):
+        authorizations.append(request.headers["Authorization"])
+        started.set()
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json=query_payload)
+
+    transport = httpx.MockTransport(handler)
+    stale = SyncCRMAAPIClient(conn, transport=transport)
+    stale_client = stale.client
+    refreshed_conn = conn.copy(update={"access_token": "refreshed"})
+    refreshed = SyncCRMAAPIClient(refreshed_conn, transport=transport)
+    with ThreadPoolExecutor(1) as executor:
+        future = executor.submit(stale.query, "q = load ...;")
+        assert started.wait(5)
+        refreshed_client = refreshed.client
+        assert not stale_client._client.is_closed
+        future.result()
+
+    assert stale_client._client.is_closed
+    assert refreshed_client is not stale_client
+    assert refreshed.query("q = load ...;")
+    assert authorizations == ["Bearer token", "Bearer refreshed"]
@@ -0,0 +1,31 @@
+"""Contains unit tests for the transport module"""
+
+import httpx
+import pytest
+
+from crma_api_client.client import CRMAAPIClient
+from crma_api_client.transport import (
+    read_archive,
+    RecordingTransport,
+    ReplayMissError,
+    ReplayTransport,
+)
+
+
+async def test_record_and_replay(conn, tmp_path, query_payload):
+    """Should record exchanges and replay them without the network"""
+    path = tmp_path / "archive.jsonl.gz"
+    mock = httpx.MockTransport(lambda request: httpx.Response(200, json=query_payload))
+    async with CRMAAPIClient(conn, transport=RecordingTransport(path, mock)) as client:
+        recorded = await client.query("q = load ...;")
+
+    (exchange,) = read_archive(path)
+    assert exchange.method == "POST"
+    assert "authorization" not in exchange.request_headers
+
+    other_conn = conn.copy(update={"instance_url": "https://other.my.salesforce.com"})
+    async with CRMAAPIClient(other_conn, transport=ReplayTransport(path)) as client:
+        replayed = await client.query("q = load ...;", name="different-name")
+        assert replayed == recorded
+        with pytest.raises(ReplayMissError):
+            await client.query("q = load other;")